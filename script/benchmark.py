@@ -0,0 +1,538 @@
+"""Benchmarks of the retina, dataset and gui hot paths.
+
+Run the benchmarks and store the results as JSON:
+
+    python script/benchmark.py run -o results.json
+
+Every benchmark has two passes. The latency pass times the calls after
+warm-up calls. The memory pass runs the same calls in a fresh subprocess
+and reads its peak resident set size (RSS), from /proc on Linux and by
+resource.getrusage elsewhere, so the buffers of OpenCV and ffmpeg are
+counted and the timings are not slowed down by the measurement. There
+is no memory pass where the resource module is missing (Windows).
+
+Compare two result files, the exit status is 1 if a benchmark got slower
+than the threshold:
+
+    python script/benchmark.py compare old.json new.json
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from simretina import dataset, gui, package_data_path, retina
+
+# (name, height, width)
+RESOLUTIONS = [("qcif", 144, 176),
+               ("cif", 288, 352),
+               ("vga", 480, 640),
+               ("720p", 720, 1280),
+               ("1080p", 1080, 1920),
+               ("4k", 2160, 3840)]
+
+CLIP_LENGTHS = [10, 50]
+
+VIDEOS = ["HorseRiding.avi", "TaiChi.avi"]
+
+# (height, width, number of streams) of the batch retina benchmarks
+BATCH_CASES = [(24, 32, 64),
+               (48, 64, 32),
+               (120, 160, 16),
+               (240, 320, 8)]
+
+# untimed calls before the timed calls of a benchmark
+WARMUP_CALLS = 1
+
+
+def get_frames(height, width, num_frames):
+    """Make a reproducible clip of moving color noise."""
+    rng = np.random.RandomState(42)
+    base = rng.randint(0, 256, size=(height, width+num_frames, 3))
+    base = base.astype(np.uint8)
+    return [np.ascontiguousarray(base[:, idx:idx+width])
+            for idx in range(num_frames)]
+
+
+def make_clip(vid_path, height, width, num_frames):
+    """Encode a reproducible clip of moving color blobs as MJPG."""
+    # smooth content, noise makes files that are large and slow to decode
+    rng = np.random.RandomState(42)
+    base = rng.randint(0, 256, size=(height//16+1,
+                                     (width+num_frames)//16+1, 3))
+    base = cv2.resize(base.astype(np.uint8), (width+num_frames, height),
+                      interpolation=cv2.INTER_CUBIC)
+
+    writer = cv2.VideoWriter(vid_path, cv2.VideoWriter_fourcc(*"MJPG"),
+                             30., (width, height))
+    if not writer.isOpened():
+        raise IOError("Can not write the video %s." % (vid_path))
+    for idx in range(num_frames):
+        writer.write(np.ascontiguousarray(base[:, idx:idx+width]))
+    writer.release()
+
+
+def make_case(case):
+    """Build the function of a benchmark.
+
+    Parameters
+    ----------
+    case : dictionary
+        the "name" of the benchmark, the "height", "width" and
+        "num_frames" of the frames, the "num_streams" of the batch
+        benchmarks and the "vid_path" of the video benchmarks
+
+    Returns
+    -------
+    fn : callable
+        the function to time, called with the call index
+    calls : int
+        number of calls
+    num_items : int
+        number of frames processed by a call
+    """
+    name = case["name"]
+    height, width = case["height"], case["width"]
+    num_frames = case["num_frames"]
+
+    if name == "get_video":
+        return (lambda idx: dataset.get_video(case["vid_path"], size=False),
+                3, num_frames)
+
+    if name in ("get_opl_batch", "opl_loop_numpy", "opl_loop_opencv"):
+        num_streams = case["num_streams"]
+        batches = np.stack([np.stack(get_frames(height, width, num_frames))]
+                           * num_streams, axis=1)
+        if name == "get_opl_batch":
+            eye = retina.init_batch_retina((height, width), num_streams)
+            return (lambda idx: retina.get_opl_batch(eye, batches[idx]),
+                    num_frames, num_streams)
+
+        backend = name[len("opl_loop_"):]
+        eyes = [retina.init_retina((height, width), backend=backend)
+                for stream in range(num_streams)]
+
+        def run_loop(idx):
+            for stream, stream_eye in enumerate(eyes):
+                retina.get_opl_frame(stream_eye, batches[idx, stream])
+        return run_loop, num_frames, num_streams
+
+    frames = get_frames(height, width, num_frames)
+    # the widget is larger than the frame so that a border is added
+    wg_h, wg_w = int(height*1.25), int(width*1.25)
+
+    if name in ("get_opl_frame", "get_opl_frame_numpy"):
+        eye = retina.init_retina((height, width),
+                                 backend="numpy" if name.endswith("numpy")
+                                 else "opencv")
+        return (lambda idx: retina.get_opl_frame(eye, frames[idx]),
+                num_frames, 1)
+    elif name == "get_opl_frames":
+        eye = retina.init_retina((height, width))
+        return (lambda idx: retina.get_opl_frames(eye, frames),
+                1, num_frames)
+    elif name == "gray2color":
+        gray_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                       for frame in frames]
+        return (lambda idx: retina.gray2color(gray_frames[idx]),
+                num_frames, 1)
+    elif name == "fit_frame":
+        return (lambda idx: gui.fit_frame(frames[idx], wg_h, wg_w),
+                num_frames, 1)
+    elif name == "cv2pg":
+        return (lambda idx: gui.cv2pg(frames[idx], wg_h, wg_w),
+                num_frames, 1)
+    elif name == "create_viewer_field":
+        return (lambda idx: gui.create_viewer_field(
+            [frames[idx], frames[idx], frames[idx]]), num_frames, 1)
+
+    raise ValueError("Unknown benchmark %s." % (name))
+
+
+def run_calls(fn, calls, warmup_calls):
+    """Make the warm-up calls, then time the calls.
+
+    Returns
+    -------
+    latencies : list
+        the duration of each timed call in seconds
+    """
+    for idx in range(warmup_calls):
+        fn(idx % calls)
+
+    latencies = []
+    for idx in range(calls):
+        start_time = time.time()
+        fn(idx)
+        latencies.append(time.time()-start_time)
+
+    return latencies
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process to its current RSS.
+
+    Only Linux can reset it, elsewhere the peak RSS never goes down.
+
+    Returns
+    -------
+    reset : bool
+        True if the peak RSS was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as refs_file:
+            refs_file.write("5")
+    except (IOError, OSError):
+        return False
+
+    return True
+
+
+def get_peak_rss():
+    """Get the peak resident set size of this process in MB."""
+    # the high water mark of Linux follows reset_peak_rss, ru_maxrss not
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])/1024.
+    except (IOError, OSError):
+        pass
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak_rss/1024./1024.
+    return peak_rss/1024.
+
+
+def measure_memory(case, warmup_calls):
+    """Run a benchmark and get the peak RSS of this process.
+
+    Call it in a fresh process. The increase is exact where the peak RSS
+    can be reset after the setup of the benchmark (Linux), elsewhere it
+    is zero unless the calls go beyond the peak of the imports and the
+    setup.
+
+    Returns
+    -------
+    memory : dictionary
+        the "peak_rss_mb" of the calls and the "rss_increase_mb" of the
+        calls over the setup of the benchmark
+    """
+    fn, calls, _ = make_case(case)
+    reset_peak_rss()
+    setup_rss = get_peak_rss()
+    run_calls(fn, calls, warmup_calls)
+    peak_rss = get_peak_rss()
+
+    return {"peak_rss_mb": peak_rss,
+            "rss_increase_mb": peak_rss-setup_rss}
+
+
+def measure(case, warmup_calls=WARMUP_CALLS, memory=True):
+    """Run the latency pass and the memory pass of a benchmark.
+
+    Parameters
+    ----------
+    case : dictionary
+        the benchmark, see make_case
+    warmup_calls : int
+        number of untimed calls before the timed calls
+    memory : bool
+        run the memory pass in a subprocess if True
+
+    Returns
+    -------
+    result : dictionary
+        the case with the throughput in frames per second, the latency
+        percentiles in milliseconds and the peak RSS in MB
+    """
+    fn, calls, num_items = make_case(case)
+    latencies = np.array(run_calls(fn, calls, warmup_calls))*1000.
+    del fn
+
+    result = dict(case)
+    result.update({
+        "throughput": calls*num_items/max(latencies.sum()/1000., 1e-12),
+        "latency_ms": {"mean": float(latencies.mean()),
+                       "p50": float(np.percentile(latencies, 50)),
+                       "p90": float(np.percentile(latencies, 90)),
+                       "p99": float(np.percentile(latencies, 99))},
+        "peak_rss_mb": None,
+        "rss_increase_mb": None})
+
+    if memory is True and resource is not None:
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), "memory",
+             json.dumps(case), "--warmup", str(warmup_calls)])
+        result.update(json.loads(output.decode().strip().split("\n")[-1]))
+
+    print("%-24s %-10s %5s frames %10.1f fps %10.2f ms (p50) %s"
+          % (case["name"], case.get("resolution", ""),
+             case.get("num_frames", ""), result["throughput"],
+             result["latency_ms"]["p50"],
+             "" if result["rss_increase_mb"] is None else
+             "%8.1f MB (RSS increase)" % (result["rss_increase_mb"])))
+
+    return result
+
+
+def get_resolution_cases(res_name, height, width, clip_lengths):
+    """Get the benchmarks of one resolution."""
+    cases = []
+    info = {"resolution": res_name, "height": height, "width": width}
+
+    for num_frames in clip_lengths:
+        for name in ("get_opl_frame", "get_opl_frames"):
+            cases.append(dict(info, name=name, num_frames=num_frames))
+
+    # the numpy backend and the per frame functions, run on a short clip
+    for name in ("get_opl_frame_numpy", "gray2color", "fit_frame", "cv2pg",
+                 "create_viewer_field"):
+        cases.append(dict(info, name=name, num_frames=min(clip_lengths)))
+
+    return cases
+
+
+def get_batch_cases(num_steps=10):
+    """Get the benchmarks of a batch retina and of loops over retinas.
+
+    The throughputs are in frames per second over all streams, see
+    print_ratios for the comparison.
+    """
+    cases = []
+    for height, width, num_streams in BATCH_CASES:
+        info = {"resolution": "%dx%d" % (width, height), "height": height,
+                "width": width, "num_frames": num_steps,
+                "num_streams": num_streams}
+        for name in ("get_opl_batch", "opl_loop_numpy", "opl_loop_opencv"):
+            cases.append(dict(info, name=name))
+
+    return cases
+
+
+def print_ratios(results):
+    """Print the throughput ratios of the backends and of the batch retina.
+
+    Returns
+    -------
+    ratios : list
+        (name, reference, resolution, ratio) of the throughput of name
+        over the throughput of reference
+    """
+    pairs = [("get_opl_frame_numpy", "get_opl_frame"),
+             ("get_opl_batch", "opl_loop_numpy"),
+             ("get_opl_batch", "opl_loop_opencv")]
+    throughputs = dict(((result["name"], result.get("resolution"),
+                         result.get("num_frames")), result["throughput"])
+                       for result in results)
+
+    ratios = []
+    for (name, resolution, num_frames), throughput in sorted(
+            throughputs.items()):
+        for pair_name, reference in pairs:
+            reference_key = (reference, resolution, num_frames)
+            if name == pair_name and reference_key in throughputs:
+                ratios.append((name, reference, resolution,
+                               throughput/throughputs[reference_key]))
+
+    for name, reference, resolution, ratio in ratios:
+        print("%-24s %-10s %8.2fx %s" % (name, resolution, ratio, reference))
+
+    return ratios
+
+
+def get_video_cases(clip_dir, resolutions, num_frames):
+    """Get the decoding benchmarks.
+
+    The bundled videos are 320x240, clips of the other resolutions are
+    encoded in clip_dir.
+    """
+    vid_paths = [os.path.join(package_data_path, video) for video in VIDEOS]
+    for res_name, height, width in resolutions:
+        vid_path = os.path.join(clip_dir, "%s.avi" % (res_name))
+        make_clip(vid_path, height, width, num_frames)
+        vid_paths.append(vid_path)
+
+    cases = []
+    for vid_path in vid_paths:
+        video = dataset.Video(vid_path)
+        height, width = video.shape[:2]
+        cases.append({"name": "get_video",
+                      "video": os.path.basename(vid_path),
+                      "vid_path": vid_path,
+                      "resolution": "%dx%d" % (width, height),
+                      "height": height, "width": width,
+                      "num_frames": len(video)})
+
+    return cases
+
+
+def get_metadata():
+    """Describe the code and the machine the benchmarks ran on."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor()}
+
+
+def run(args):
+    """Run the benchmarks and write the results."""
+    resolutions = [resolution for resolution in RESOLUTIONS
+                   if not args.resolutions or
+                   resolution[0] in args.resolutions]
+
+    cases = []
+    for res_name, height, width in resolutions:
+        cases += get_resolution_cases(res_name, height, width,
+                                      args.clip_lengths)
+    if args.batch:
+        cases += get_batch_cases()
+
+    clip_dir = tempfile.mkdtemp(prefix="simretina-benchmark-")
+    try:
+        if args.videos:
+            cases += get_video_cases(clip_dir, resolutions,
+                                     min(args.clip_lengths))
+
+        results = []
+        for case in cases:
+            result = measure(case, args.warmup, args.memory)
+            # the path of a synthetic clip is gone after the run
+            result.pop("vid_path", None)
+            results.append(result)
+    finally:
+        shutil.rmtree(clip_dir)
+
+    ratios = print_ratios(results)
+
+    metadata = get_metadata()
+    metadata["warmup_calls"] = args.warmup
+    with open(args.output, "w") as result_file:
+        json.dump({"metadata": metadata, "results": results,
+                   "ratios": ratios}, result_file, indent=2, sort_keys=True)
+    print("Results are saved to %s" % (args.output))
+
+
+def memory(args):
+    """Run the memory pass of a benchmark and print it as JSON."""
+    print(json.dumps(measure_memory(json.loads(args.case), args.warmup)))
+
+
+def get_key(result):
+    """Identify a benchmark across result files."""
+    return (result["name"], result.get("resolution"),
+            result.get("num_frames"), result.get("video"))
+
+
+def compare(args):
+    """Compare the throughputs of two result files."""
+    with open(args.old) as result_file:
+        old_results = json.load(result_file)["results"]
+    with open(args.new) as result_file:
+        new_results = json.load(result_file)["results"]
+
+    old_results = dict((get_key(result), result) for result in old_results)
+
+    num_regressions = 0
+    for result in new_results:
+        key = get_key(result)
+        if key not in old_results:
+            continue
+        ratio = result["throughput"]/old_results[key]["throughput"]
+        status = ""
+        if ratio < 1.-args.threshold:
+            status = "REGRESSION"
+            num_regressions += 1
+        elif ratio > 1.+args.threshold:
+            status = "improved"
+        print("%-24s %-10s %5s frames %8.2fx %s"
+              % (key[0], key[1], key[2], ratio, status))
+
+    print("%d regression(s)" % (num_regressions))
+    return 1 if num_regressions > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output", default="benchmark.json",
+                            help="path of the JSON results")
+    run_parser.add_argument("-r", "--resolutions", nargs="*",
+                            help="resolutions to run, e.g. qcif vga 4k, "
+                                 "all if not given")
+    run_parser.add_argument("-l", "--clip-lengths", nargs="+", type=int,
+                            default=CLIP_LENGTHS,
+                            help="clip lengths in frames")
+    run_parser.add_argument("-w", "--warmup", type=int,
+                            default=WARMUP_CALLS,
+                            help="untimed calls before the timed calls")
+    run_parser.add_argument("--no-memory", dest="memory",
+                            action="store_false",
+                            help="skip the memory passes")
+    run_parser.add_argument("--no-batch", dest="batch",
+                            action="store_false",
+                            help="skip the batch retina benchmarks")
+    run_parser.add_argument("--no-videos", dest="videos",
+                            action="store_false",
+                            help="skip the video decoding benchmarks")
+
+    memory_parser = subparsers.add_parser(
+        "memory", help="run the memory pass of a benchmark, used by run")
+    memory_parser.add_argument("case", help="the benchmark as JSON")
+    memory_parser.add_argument("-w", "--warmup", type=int,
+                               default=WARMUP_CALLS,
+                               help="untimed calls before the timed calls")
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare two result files")
+    compare_parser.add_argument("old", help="the reference results")
+    compare_parser.add_argument("new", help="the new results")
+    compare_parser.add_argument("-t", "--threshold", type=float,
+                                default=0.1,
+                                help="relative throughput change that is "
+                                     "reported")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "memory":
+        memory(args)
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
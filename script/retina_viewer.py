@@ -11,7 +11,7 @@ from pyqtgraph.widgets.RawImageWidget import RawImageWidget
 from pyqtgraph.widgets.FileDialog import FileDialog
 from pyqtgraph.widgets.ComboBox import ComboBox
 
-from simretina import dataset, gui, retina
+from simretina import dataset, gui, pipeline, retina
 
 # global parameters
 win_width = 1280
@@ -342,8 +342,8 @@ manual_layout.addWidget(MAGNO_wg)
 viewer_layout.addWidget(frame_wg, 0, 0)
 viewer_layout.addWidget(manual_wg, 1, 0)
 
-# setup retina
-eye = retina.init_retina(bg_frame.shape[:2])
+# setup retina pool and retina
+eye_pool = retina.RetinaPool()
 
 # get parameter collection
 cm_state = gui.color_mode_option(cm_wg)
@@ -365,7 +365,7 @@ m_vcp_wg_val = m_vcp_wg.value()/100.
 m_lait_wg_val = gui.line_edit_val(m_lait_wg, 0.)
 m_laik_wg_val = gui.line_edit_val(m_laik_wg, 7.)
 
-eye_para_dict = retina.create_para_dict(
+eye_para_dict = retina.RetinaParams(
                     color_mode=cm_state,
                     normalise_output_parvo=p_no_state,
                     photoreceptors_local_adaptation_sensitivity=p_plas_wg_val,
@@ -385,8 +385,7 @@ eye_para_dict = retina.create_para_dict(
                     local_adapt_integration_k=m_laik_wg_val)
 
 eye_para_dict_old = eye_para_dict
-retina.apply_para_dict(eye, eye_para_dict)
-retina.clear_buffers(eye)
+eye = eye_pool.get(bg_frame.shape[:2], eye_para_dict)
 
 frame_idx = 0
 frame_len = 0
@@ -419,7 +418,7 @@ def update():
     m_laik_wg_val = gui.line_edit_val(m_laik_wg, 7.)
 
     # setup current paramete dictionary
-    eye_para_dict = retina.create_para_dict(
+    eye_para_dict = retina.RetinaParams(
                      color_mode=cm_state,
                      normalise_output_parvo=p_no_state,
                      photoreceptors_local_adaptation_sensitivity=p_plas_wg_val,
@@ -440,13 +439,13 @@ def update():
 
     if not retina.compare_para_dict(eye_para_dict_old, eye_para_dict):
         eye_para_dict_old = eye_para_dict
-        retina.apply_para_dict(eye, eye_para_dict)
-        retina.clear_buffers(eye)
+        eye = eye_pool.reconfigure(eye, eye_para_dict)
 
     if dis_wg.currentText() == "Image":
         if vid_stream is not None:
             vid_stream.release()
             vid_stream = None
+            viewer_window.setWindowTitle("Retina Simulation")
         exp_wg_curr = exp_wg.currentText()
         if exp_wg_curr != exp_wg_prev:
             # if example sequence is changed
@@ -460,9 +459,7 @@ def update():
 
                 frame = gui.resize(frame, (frame_wid, frame_height),
                                    ratio_keep=True)
-                eye = retina.init_retina(frame.shape[:2])
-                retina.apply_para_dict(eye, eye_para_dict)
-                retina.clear_buffers(eye)
+                eye = eye_pool.get(frame.shape[:2], eye_para_dict)
             exp_wg_prev = exp_wg_curr
         elif exp_wg_curr == exp_wg_prev:
             if exp_wg_curr in ["None", "Horse Riding (Video)",
@@ -472,6 +469,7 @@ def update():
         if vid_stream is not None:
             vid_stream.release()
             vid_stream = None
+            viewer_window.setWindowTitle("Retina Simulation")
         exp_wg_curr = exp_wg.currentText()
         if exp_wg_curr != exp_wg_prev:
             if exp_wg_curr == "Horse Riding (Video)":
@@ -485,9 +483,7 @@ def update():
             for frame in t_frames:
                 frames.append(gui.resize(frame, (frame_wid, frame_height),
                                          ratio_keep=True))
-            eye = retina.init_retina(frames[0].shape[:2])
-            retina.apply_para_dict(eye, eye_para_dict)
-            retina.clear_buffers(eye)
+            eye = eye_pool.get(frames[0].shape[:2], eye_para_dict)
             frame = frames[0]
             frame_idx = 0
             frame_len = len(frames)
@@ -503,20 +499,24 @@ def update():
     elif dis_wg.currentText() == "Webcam":
         exp_wg.setCurrentIndex(0)
         if vid_stream is None:
-            vid_stream = cv2.VideoCapture(0)
-        _, frame = vid_stream.read()
+            # only the newest camera frame is processed
+            vid_stream = pipeline.LiveSource(cv2.VideoCapture(0),
+                                             latency_budget=0.2)
+            vid_stream.start()
+        frame = vid_stream.read()
+        if frame is None:
+            frame = bg_frame
         frame = gui.resize(frame, (frame_wid, frame_height),
                            ratio_keep=True)
         eye_size = eye.getInputSize()
         if eye_size[0] != frame.shape[1] or eye_size[1] != frame.shape[0]:
-            eye = retina.init_retina(frame.shape[:2])
-            retina.apply_para_dict(eye, eye_para_dict)
-            retina.clear_buffers(eye)
+            eye = eye_pool.get(frame.shape[:2], eye_para_dict)
     elif dis_wg.currentText() == "Image (External)":
         exp_wg.setCurrentIndex(0)
         if vid_stream is not None:
             vid_stream.release()
             vid_stream = None
+            viewer_window.setWindowTitle("Retina Simulation")
         if file_name != file_name_prev:
             if file_name != "":
                 if dataset.check_image_file(str(file_name)):
@@ -528,9 +528,7 @@ def update():
 
             frame = gui.resize(frame, (frame_wid, frame_height),
                                ratio_keep=True)
-            eye = retina.init_retina(frame.shape[:2])
-            retina.apply_para_dict(eye, eye_para_dict)
-            retina.clear_buffers(eye)
+            eye = eye_pool.get(frame.shape[:2], eye_para_dict)
 
             file_name_prev = file_name
         elif file_name == file_name_prev:
@@ -541,6 +539,7 @@ def update():
         if vid_stream is not None:
             vid_stream.release()
             vid_stream = None
+            viewer_window.setWindowTitle("Retina Simulation")
         if file_name != file_name_prev:
             if file_name != "":
                 if dataset.check_video_file(str(file_name)):
@@ -552,9 +551,7 @@ def update():
             for frame in t_frames:
                 frames.append(gui.resize(frame, (frame_wid, frame_height),
                                          ratio_keep=True))
-            eye = retina.init_retina(frames[0].shape[:2])
-            retina.apply_para_dict(eye, eye_para_dict)
-            retina.clear_buffers(eye)
+            eye = eye_pool.get(frames[0].shape[:2], eye_para_dict)
             frame = frames[0]
             frame_idx = 0
             frame_len = len(frames)
@@ -586,6 +583,13 @@ def update():
     draw_magno.setImage(magno_frame)
     viewer_app.processEvents()
 
+    if vid_stream is not None:
+        vid_stream.mark_done()
+        live_stats = vid_stream.stats()
+        viewer_window.setWindowTitle(
+            "Retina Simulation (%.1f FPS, %d dropped)"
+            % (live_stats["fps"], live_stats["dropped"]+live_stats["skipped"]))
+
 timer = QtCore.QTimer()
 timer.timeout.connect(update)
 timer.start(0)
@@ -4,12 +4,22 @@ Author: Yuhuang Hu
 Email : yuhuang.hu@uzh.ch
 """
 
+import bisect
+import hashlib
 import os
+import subprocess
+import tempfile
 from os.path import join
 import cv2
+import numpy as np
+from moviepy.config import get_setting
 from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 
-from simretina import package_data_path
+from simretina import package_data_path, profiling
+
+# default bound of the decoded videos in the cache, see get_cached_video
+CACHE_MAX_SIZE = 4*1024**3
 
 
 def check_image_file(file_name):
@@ -80,10 +90,11 @@ def get_image(image_path, color=True, size=True):
     size : tuple
         size of the frame (optional).
     """
-    frame = cv2.imread(image_path)
+    with profiling.stage("dataset.get_image"):
+        frame = cv2.imread(image_path)
 
-    if color is False:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if color is False:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
     if size is True:
         return frame, frame.shape
@@ -91,7 +102,122 @@ def get_image(image_path, color=True, size=True):
         return frame
 
 
-def get_video(vid_path, color=True, size=True):
+def iter_images(image_dir, color=True):
+    """Iterate the image files of a directory.
+
+    Parameters
+    ----------
+    image_dir : string
+        target directory absolute path
+    color : bool
+        if color is True then yield color frames with BGR encoding.
+        if color is False then yield grey scale frames.
+
+    Yields
+    ------
+    image_path : string
+        path of the image, in alphabetical order
+    frame : numpy.ndarray
+        a frame that contains the image
+    """
+    if not os.path.isdir(image_dir):
+        raise ValueError("The given directory is not existed!")
+
+    for file_name in sorted(os.listdir(image_dir)):
+        image_path = join(image_dir, file_name)
+        if os.path.isfile(image_path) and check_image_file(image_path):
+            yield image_path, get_image(image_path, color=color, size=False)
+
+
+class Video(object):
+    """A video that decodes its frames on demand.
+
+    The video supports len(), indexing, slicing (which returns a lazy
+    Video of the selected frames) and iteration, and holds at most one
+    decoded frame. The frames are the ones of get_video. The decoder is
+    opened at the first access and closed by close() or at the end of a
+    with block.
+
+    Parameters
+    ----------
+    vid_path : string
+        target video absolute path
+    color : bool
+        if color is True then return color frames with BGR encoding.
+        if color is False then return grey scale frames.
+    indices : range
+        the frame indices of the video, all frames if None
+    """
+
+    def __init__(self, vid_path, color=True, indices=None):
+        infos = ffmpeg_parse_infos(vid_path)
+
+        self.vid_path = vid_path
+        self.color = color
+        self.fps = infos["video_fps"]
+        width, height = infos["video_size"]
+        self.shape = (height, width, 3) if color is True else \
+            (height, width)
+
+        if indices is None:
+            indices = range(infos["video_nframes"])
+        self.indices = indices
+        self._reader = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for idx in self.indices:
+            yield self._read(idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return Video(self.vid_path, self.color,
+                         indices=self.indices[idx])
+
+        return self._read(self.indices[idx])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _read(self, idx):
+        """Decode a frame of the file."""
+        if self._reader is None:
+            self._reader = FFMPEG_VideoReader(self.vid_path)
+
+        with profiling.stage("dataset.decode"):
+            # the reader moves between adjacent frames without seeking,
+            # the frame idx of get_video is at position idx+1. The frame
+            # count is estimated from the duration, frames past the end
+            # of the stream repeat the last one as in get_video
+            position = idx+1
+            while True:
+                try:
+                    frame = self._reader.get_frame(position/self.fps)
+                    break
+                except IOError:
+                    if position == 0:
+                        raise
+                    position -= 1
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            if self.color is False:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        return frame
+
+    def close(self):
+        """Close the decoder, it is opened again when needed."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+def get_video(vid_path, color=True, size=True, lazy=False, cache=False):
     """Get video by given video path.
 
     Parameters
@@ -104,22 +230,42 @@ def get_video(vid_path, color=True, size=True):
     size : bool
         if size is True then return the size of the frame.
         if size is False then just return the frame.
+    lazy : bool
+        if True, return a Video that decodes the frames on demand
+        instead of a list, so the memory does not grow with the length
+        of the video
+    cache : bool
+        if True, return the memory-mapped frames of the on-disk cache of
+        decoded videos, see get_cached_video
 
     Returns
     -------
-    frames : list
+    frames : list, Video or numpy.memmap
         a list of frames that contains the video
     size : tuple
         size of the frame (optional).
     """
+    if lazy is True or cache is True:
+        if lazy is True:
+            frames = Video(vid_path, color=color)
+            frame_shape = frames.shape
+        else:
+            frames = get_cached_video(vid_path, color=color)
+            frame_shape = frames.shape[1:]
+        if size is True:
+            return frames, frame_shape
+        else:
+            return frames
+
     vid_container = FFMPEG_VideoReader(vid_path)
 
     frames = []
     for i in range(vid_container.nframes):
-        frame_t = vid_container.read_frame()
-        frame_t = cv2.cvtColor(frame_t, cv2.COLOR_RGB2BGR)
-        if color is False:
-            frame_t = cv2.cvtColor(frame_t, cv2.COLOR_BGR2GRAY)
+        with profiling.stage("dataset.decode"):
+            frame_t = vid_container.read_frame()
+            frame_t = cv2.cvtColor(frame_t, cv2.COLOR_RGB2BGR)
+            if color is False:
+                frame_t = cv2.cvtColor(frame_t, cv2.COLOR_BGR2GRAY)
         frames.append(frame_t)
 
     if size is True:
@@ -128,6 +274,359 @@ def get_video(vid_path, color=True, size=True):
         return frames
 
 
+def iter_video(vid_path, color=True):
+    """Iterate the frames of a video by given video path.
+
+    The frames are decoded on demand, so only one frame is held in
+    memory at a time.
+
+    Parameters
+    ----------
+    vid_path : string
+        target video absolute path
+    color : bool
+        if color is True then yield color frames with BGR encoding.
+        if color is False then yield grey scale frames.
+
+    Yields
+    ------
+    frame : numpy.ndarray
+        the next frame of the video
+    """
+    vid_container = FFMPEG_VideoReader(vid_path)
+
+    try:
+        for i in range(vid_container.nframes):
+            with profiling.stage("dataset.decode"):
+                frame_t = vid_container.read_frame()
+                frame_t = cv2.cvtColor(frame_t, cv2.COLOR_RGB2BGR)
+                if color is False:
+                    frame_t = cv2.cvtColor(frame_t, cv2.COLOR_BGR2GRAY)
+            yield frame_t
+    finally:
+        vid_container.close()
+
+
+def get_cache_dir(cache_dir=None):
+    """Get the directory of the keyframe indices and decoded videos.
+
+    Parameters
+    ----------
+    cache_dir : string
+        the directory, if None the environment variable
+        SIMRETINA_CACHE_DIR is used, and ~/.simretina/cache if not set
+
+    Returns
+    -------
+    cache_dir : string
+        the existing cache directory
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "SIMRETINA_CACHE_DIR",
+            join(os.path.expanduser("~"), ".simretina", "cache"))
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    return cache_dir
+
+
+def get_file_key(vid_path, *options):
+    """Identify a video file by its path, size, mtime and given options."""
+    vid_path = os.path.abspath(vid_path)
+    stat = os.stat(vid_path)
+    key = "%s|%d|%d" % (vid_path, stat.st_size, int(stat.st_mtime*1e6))
+    for option in options:
+        key += "|%s" % (option,)
+
+    return os.path.splitext(os.path.basename(vid_path))[0]+"-" + \
+        hashlib.md5(key.encode("utf-8")).hexdigest()[:16]
+
+
+def build_keyframe_index(vid_path):
+    """Build the keyframe index of a video.
+
+    The packets of the video stream are listed by ffmpeg without
+    decoding them.
+
+    Parameters
+    ----------
+    vid_path : string
+        target video absolute path
+
+    Returns
+    -------
+    index : dictionary
+        "frame_times", the timestamps of all frames in display order in
+        seconds from the start of the stream, and "keyframes", the frame
+        numbers of the keyframes
+    """
+    cmd = [get_setting("FFMPEG_BINARY"), "-loglevel", "error",
+           "-i", vid_path, "-map", "0:v:0", "-c", "copy",
+           "-f", "framecrc", "-"]
+    output = subprocess.check_output(cmd).decode("utf-8")
+
+    time_base = None
+    pts = []
+    key_pts = []
+    for line in output.splitlines():
+        if line.startswith("#tb 0:"):
+            num, den = line.split(":")[1].strip().split("/")
+            time_base = float(num)/float(den)
+        if line.startswith("#") or not line.strip():
+            continue
+        fields = [field.strip() for field in line.split(",")]
+        # stream, dts, pts, duration, size, hash[, F=flags]
+        packet_pts = fields[1] if fields[2] == "NOPTS" else fields[2]
+        pts.append(int(packet_pts))
+        if len(fields) < 7 or int(fields[6][2:], 16) & 1:
+            key_pts.append(int(packet_pts))
+
+    if time_base is None or len(pts) == 0:
+        raise ValueError("No video stream is found in %s." % (vid_path))
+
+    pts = np.sort(np.array(pts, dtype=np.int64))
+    keyframes = np.searchsorted(pts, np.array(key_pts, dtype=np.int64))
+
+    return {"frame_times": (pts-pts[0])*time_base,
+            "keyframes": np.unique(keyframes)}
+
+
+def get_keyframe_index(vid_path, cache_dir=None):
+    """Get the keyframe index of a video, built once and stored on disk.
+
+    Parameters
+    ----------
+    vid_path : string
+        target video absolute path
+    cache_dir : string
+        directory of the stored indices, see get_cache_dir
+
+    Returns
+    -------
+    index : dictionary
+        see build_keyframe_index
+    """
+    index_path = join(get_cache_dir(cache_dir),
+                      get_file_key(vid_path)+".keyframes.npz")
+
+    if os.path.isfile(index_path):
+        with np.load(index_path) as index_file:
+            return {"frame_times": index_file["frame_times"],
+                    "keyframes": index_file["keyframes"]}
+
+    index = build_keyframe_index(vid_path)
+    np.savez(index_path, **index)
+
+    return index
+
+
+def _open_decoder(vid_path, start_time):
+    """Start ffmpeg decoding BGR frames from a given time."""
+    cmd = [get_setting("FFMPEG_BINARY"), "-loglevel", "error",
+           "-ss", "%.6f" % (start_time), "-i", vid_path,
+           "-map", "0:v:0", "-f", "image2pipe", "-pix_fmt", "bgr24",
+           "-vcodec", "rawvideo", "-"]
+    with open(os.devnull, "w") as devnull:
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=devnull)
+
+
+def _close_decoder(proc):
+    """Stop a decoder started by _open_decoder."""
+    proc.stdout.close()
+    if proc.poll() is None:
+        proc.terminate()
+    proc.wait()
+
+
+def get_frames(vid_path, indices, color=True, cache_dir=None):
+    """Get frames of a video by random access.
+
+    The decoder seeks to the keyframe before each requested frame and
+    decodes forward, it only restarts when a requested frame is behind
+    it or a keyframe lies between it and the frame. So the cost follows
+    the number of requested frames instead of their positions.
+
+    Parameters
+    ----------
+    vid_path : string
+        target video absolute path
+    indices : list
+        frame indices, as in the list returned by get_video, negative
+        indices count from the end like list indices
+    color : bool
+        if color is True then return color frames with BGR encoding.
+        if color is False then return grey scale frames.
+    cache_dir : string
+        directory of the keyframe indices, see get_cache_dir
+
+    Returns
+    -------
+    frames : list
+        the frames in the order of indices
+
+    Raises
+    ------
+    IndexError
+        if an index is out of the range of the video
+    """
+    infos = ffmpeg_parse_infos(vid_path)
+    video_length = infos["video_nframes"]
+    indices = [idx+video_length if idx < 0 else idx for idx in indices]
+    for idx in indices:
+        if idx < 0 or idx >= video_length:
+            raise IndexError("Frame index %d is out of range for a video "
+                             "of %d frames." % (idx, video_length))
+
+    index = get_keyframe_index(vid_path, cache_dir)
+    frame_times = index["frame_times"]
+    keyframes = list(index["keyframes"])
+    num_frames = len(frame_times)
+
+    width, height = infos["video_size"]
+    frame_bytes = width*height*3
+    # half a frame before a keyframe so that the seek does not skip it
+    half_frame = 0.5*np.diff(frame_times).min() if num_frames > 1 else 0.
+
+    # the frame idx of get_video is the frame idx+1 of the stream, the
+    # frames past the end of the stream repeat the last one
+    targets = [min(idx+1, num_frames-1) for idx in indices]
+
+    decoded = {}
+    proc = None
+    position = None
+    try:
+        for target in sorted(set(targets)):
+            keyframe = keyframes[max(bisect.bisect_right(keyframes,
+                                                         target)-1, 0)]
+            if proc is None or position > target or keyframe > position:
+                if proc is not None:
+                    _close_decoder(proc)
+                proc = _open_decoder(
+                    vid_path, max(frame_times[keyframe]-half_frame, 0.))
+                position = keyframe
+
+            while position <= target:
+                with profiling.stage("dataset.decode"):
+                    buf = proc.stdout.read(frame_bytes)
+                if len(buf) != frame_bytes:
+                    raise IOError("Failed to decode frame %d of %s."
+                                  % (position, vid_path))
+                position += 1
+            frame = np.frombuffer(buf, dtype=np.uint8).reshape(
+                height, width, 3).copy()
+            if color is False:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            decoded[target] = frame
+    finally:
+        if proc is not None:
+            _close_decoder(proc)
+
+    return [decoded[target] for target in targets]
+
+
+def get_cached_video(vid_path, color=True, cache_dir=None,
+                     max_cache_size=CACHE_MAX_SIZE):
+    """Get the frames of a video from the on-disk cache of decoded videos.
+
+    The video is decoded once into a .npy file of the cache directory,
+    keyed by the path, size and mtime of the video and the color option.
+    The file is then memory-mapped, so repeated runs read the frames
+    without decoding and slices are views. The least recently used files
+    are evicted when the cache grows over max_cache_size.
+
+    Parameters
+    ----------
+    vid_path : string
+        target video absolute path
+    color : bool
+        if color is True then return color frames with BGR encoding.
+        if color is False then return grey scale frames.
+    cache_dir : string
+        the cache directory, see get_cache_dir
+    max_cache_size : int
+        the maximum size of the decoded videos in the cache in bytes
+
+    Returns
+    -------
+    frames : numpy.memmap
+        the read-only (N, H, W, 3) or (N, H, W) frames
+    """
+    cache_dir = get_cache_dir(cache_dir)
+    cache_path = join(cache_dir, get_file_key(vid_path, color)+".npy")
+
+    if os.path.isfile(cache_path):
+        # the mtime of a cached file marks its last use
+        os.utime(cache_path, None)
+    else:
+        infos = ffmpeg_parse_infos(vid_path)
+        width, height = infos["video_size"]
+        shape = (infos["video_nframes"], height, width)
+        if color is True:
+            shape += (3,)
+
+        # a temporary file per writer, so concurrent writers of the same
+        # video do not write into each other's file
+        temp_fd, temp_path = tempfile.mkstemp(dir=cache_dir,
+                                              suffix=".tmp.npy")
+        os.close(temp_fd)
+        try:
+            frames = np.lib.format.open_memmap(
+                temp_path, mode="w+", dtype=np.uint8, shape=shape)
+            for idx, frame in enumerate(iter_video(vid_path, color=color)):
+                frames[idx] = frame
+            frames.flush()
+            del frames
+            try:
+                os.rename(temp_path, cache_path)
+            except OSError:
+                # another writer got there first, os.rename does not
+                # overwrite on Windows, its file is as good as ours
+                if not os.path.isfile(cache_path):
+                    raise
+        finally:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+        evict_cache(cache_dir, max_cache_size, keep=cache_path)
+
+    return np.load(cache_path, mmap_mode="r")
+
+
+def evict_cache(cache_dir=None, max_cache_size=CACHE_MAX_SIZE, keep=None):
+    """Remove the least recently used decoded videos from the cache.
+
+    Parameters
+    ----------
+    cache_dir : string
+        the cache directory, see get_cache_dir
+    max_cache_size : int
+        the maximum size of the decoded videos in the cache in bytes
+    keep : string
+        path of a file that is never removed
+    """
+    cache_dir = get_cache_dir(cache_dir)
+
+    cache_files = []
+    for file_name in os.listdir(cache_dir):
+        file_path = join(cache_dir, file_name)
+        if file_name.endswith(".npy") and \
+                not file_name.endswith(".tmp.npy"):
+            stat = os.stat(file_path)
+            cache_files.append((stat.st_mtime, stat.st_size, file_path))
+
+    total_size = sum(file_size for _, file_size, _ in cache_files)
+    for _, file_size, file_path in sorted(cache_files):
+        if total_size <= max_cache_size:
+            break
+        if file_path == keep:
+            continue
+        os.remove(file_path)
+        total_size -= file_size
+
+
 def get_lenna(color=True, size=True):
     """Get Lenna image.
 
@@ -209,7 +708,7 @@ def get_yuhuang(color=True, size=True):
     return get_image(yh_path, color=color, size=size)
 
 
-def get_horse_riding(color=True, size=True):
+def get_horse_riding(color=True, size=True, lazy=False):
     """Get Horse Riding video sequence.
 
     The video is retrieved from UCF-101 dataet which is
@@ -223,10 +722,12 @@ def get_horse_riding(color=True, size=True):
     size : bool
         if size is True then return the size of the frame.
         if size is False then just return the frame.
+    lazy : bool
+        return a Video that decodes the frames on demand if True
 
     Returns
     -------
-    frame : list
+    frame : list or Video
         list of frames that contains Horse Riding video.
     size : tuple
         size of the frame (optional).
@@ -234,10 +735,10 @@ def get_horse_riding(color=True, size=True):
     hr_path = join(package_data_path, "HorseRiding.avi")
     if not os.path.isfile(hr_path):
         raise ValueError("The Horse Riding video is not existed!")
-    return get_video(hr_path, color=color, size=size)
+    return get_video(hr_path, color=color, size=size, lazy=lazy)
 
 
-def get_taichi(color=True, size=True):
+def get_taichi(color=True, size=True, lazy=False):
     """Get Tai Chi video sequence.
 
     The video is retrieved from UCF-101 dataet which is
@@ -251,10 +752,12 @@ def get_taichi(color=True, size=True):
     size : bool
         if size is True then return the size of the frame.
         if size is False then just return the frame.
+    lazy : bool
+        return a Video that decodes the frames on demand if True
 
     Returns
     -------
-    frame : list
+    frame : list or Video
         list of frames that contains Tai Chi video.
     size : tuple
         size of the frame (optional).
@@ -262,4 +765,4 @@ def get_taichi(color=True, size=True):
     tc_path = join(package_data_path, "TaiChi.avi")
     if not os.path.isfile(tc_path):
         raise ValueError("The Tai Chi video is not existed!")
-    return get_video(tc_path, color=color, size=size)
+    return get_video(tc_path, color=color, size=size, lazy=lazy)
@@ -0,0 +1,172 @@
+"""Sparse DVS-style events from the magno channel.
+
+The magno output of the retina is thresholded per pixel, an event is
+emitted when the output of a pixel has changed by more than a threshold
+since the last event of that pixel, like the pixels of a Dynamic Vision
+Sensor. The events are stored in a structured array with fields
+(t, y, x, polarity), so the storage scales with the scene activity.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import numpy as np
+
+from simretina import retina
+
+EVENT_DTYPE = np.dtype([("t", np.float64),
+                        ("y", np.uint16),
+                        ("x", np.uint16),
+                        ("polarity", np.int8)])
+
+
+class EventGenerator(object):
+    """Turn a sequence of magno frames into events.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the magno frames (height, width)
+    threshold : float
+        the change of the magno output that triggers an event
+    refractory : float
+        the time after an event during which a pixel can not fire,
+        same unit as the event timestamps
+    """
+
+    def __init__(self, size, threshold=20., refractory=0.):
+        if len(size) != 2:
+            raise ValueError("Invalid size setting.")
+        if threshold <= 0:
+            raise ValueError("The threshold has to be positive.")
+        if refractory < 0:
+            raise ValueError("The refractory period can not be negative.")
+
+        self.size = (int(size[0]), int(size[1]))
+        self.threshold = threshold
+        self.refractory = refractory
+        self.reset()
+
+    def reset(self):
+        """Forget the reference levels and the last events."""
+        self.reference = None
+        self.last_time = np.full(self.size, -np.inf, dtype=np.float64)
+
+    def update(self, frame, t):
+        """Get the events of a new magno frame.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            a (H, W) magno frame, 8-bit or float
+        t : float
+            the timestamp of the frame
+
+        Returns
+        -------
+        events : numpy.ndarray
+            the events of the frame in EVENT_DTYPE, sorted by (y, x)
+        """
+        if frame.shape != self.size:
+            raise ValueError("The frame does not fit the event generator.")
+
+        frame = np.asarray(frame, dtype=np.float32)
+        if self.reference is None:
+            # the first frame only sets the reference levels
+            self.reference = frame.copy()
+            return np.empty((0,), dtype=EVENT_DTYPE)
+
+        diff = frame-self.reference
+        active = np.abs(diff) >= self.threshold
+        if self.refractory > 0:
+            active &= (t-self.last_time) >= self.refractory
+
+        y, x = np.nonzero(active)
+        events = np.empty((y.size,), dtype=EVENT_DTYPE)
+        events["t"] = t
+        events["y"] = y
+        events["x"] = x
+        events["polarity"] = np.where(diff[y, x] > 0, 1, -1)
+
+        self.reference[y, x] = frame[y, x]
+        self.last_time[y, x] = t
+
+        return events
+
+
+def iter_events(eye, frames, threshold=20., refractory=0., frame_rate=30.,
+                reopen_eye=True):
+    """Iterate the events of the magno channel frame by frame.
+
+    Only the magno channel of the retina is computed and read as float.
+
+    Parameters
+    ----------
+    eye : cv2.bioinspired_Retina
+        the retina model
+    frames : iterable
+        any iterable of given frames (list, generator, video reader, etc.)
+    threshold : float
+        the change of the magno output that triggers an event
+    refractory : float
+        the refractory period in seconds
+    frame_rate : float
+        frames per second, the timestamps are in seconds
+    reopen_eye : bool
+        clear buffers if True, else False
+
+    Yields
+    ------
+    events : numpy.ndarray
+        the events of one frame in EVENT_DTYPE
+    """
+    width, height = eye.getOutputSize()
+    generator = EventGenerator((height, width), threshold, refractory)
+
+    magno_frames = retina.iter_opl_frames(
+        eye, frames, get_parvo=False, get_magno=True,
+        reopen_eye=reopen_eye, raw=True)
+    for idx, magno_frame in enumerate(magno_frames):
+        yield generator.update(magno_frame, idx/float(frame_rate))
+
+
+def get_events(eye, frames, threshold=20., refractory=0., frame_rate=30.,
+               reopen_eye=True):
+    """Get all events of the magno channel of a sequence of frames.
+
+    Parameters
+    ----------
+    see iter_events
+
+    Returns
+    -------
+    events : numpy.ndarray
+        the events in EVENT_DTYPE, sorted by time
+    """
+    events = list(iter_events(eye, frames, threshold, refractory,
+                              frame_rate, reopen_eye))
+    if len(events) == 0:
+        return np.empty((0,), dtype=EVENT_DTYPE)
+
+    return np.concatenate(events)
+
+
+def events_to_frame(events, size):
+    """Accumulate events into a (H, W) frame of summed polarities.
+
+    Parameters
+    ----------
+    events : numpy.ndarray
+        events in EVENT_DTYPE
+    size : tuple
+        The size of the frame (height, width)
+
+    Returns
+    -------
+    frame : numpy.ndarray
+        the summed polarities per pixel
+    """
+    frame = np.zeros(size, dtype=np.int32)
+    np.add.at(frame, (events["y"], events["x"]), events["polarity"])
+
+    return frame
@@ -8,6 +8,8 @@ import sys
 import cv2
 import numpy as np
 
+from simretina import profiling
+
 
 def get_background_frame(size):
     """Get a background frame."""
@@ -34,11 +36,13 @@ def cv2pg(frame, wg_h, wg_w, bgr=True, color=[0, 0, 0]):
     if frame.ndim < 3:
         raise ValueError("Input is not a color image.")
 
-    if bgr is True:
-        frame = bgr2rgb(frame)
+    with profiling.stage("gui.cv2pg"):
+        if bgr is True:
+            frame = bgr2rgb(frame)
 
-    frame = fit_frame(frame, wg_h, wg_w, color)
-    frame = make_pg_frame(frame)
+        with profiling.stage("gui.fit_frame"):
+            frame = fit_frame(frame, wg_h, wg_w, color)
+        frame = make_pg_frame(frame)
 
     return frame
 
@@ -195,22 +199,23 @@ def create_viewer_field(frames, inter_padding=20, border_padding=40,
     viewer_frame : numpy.ndarray
         A new frame that fit in viewer's size
     """
-    viewer_frame = np.array([])
-
-    for frame in frames:
-        temp_frame = cv2.copyMakeBorder(frame, inter_padding, inter_padding,
-                                        inter_padding, inter_padding,
-                                        cv2.BORDER_CONSTANT, value=color)
-
-        if not viewer_frame.size:
-            viewer_frame = temp_frame
-        else:
-            viewer_frame = np.hstack((viewer_frame, temp_frame))
-
-    viewer_frame = cv2.copyMakeBorder(viewer_frame, inter_padding,
-                                      inter_padding, inter_padding,
-                                      inter_padding, cv2.BORDER_CONSTANT,
-                                      value=color)
+    with profiling.stage("gui.create_viewer_field"):
+        viewer_frame = np.array([])
+
+        for frame in frames:
+            temp_frame = cv2.copyMakeBorder(
+                frame, inter_padding, inter_padding, inter_padding,
+                inter_padding, cv2.BORDER_CONSTANT, value=color)
+
+            if not viewer_frame.size:
+                viewer_frame = temp_frame
+            else:
+                viewer_frame = np.hstack((viewer_frame, temp_frame))
+
+        viewer_frame = cv2.copyMakeBorder(viewer_frame, inter_padding,
+                                          inter_padding, inter_padding,
+                                          inter_padding, cv2.BORDER_CONSTANT,
+                                          value=color)
     return viewer_frame
 
 
@@ -0,0 +1,727 @@
+"""A pure NumPy implementation of the retina model.
+
+The model follows the OPL/IPL architecture of cv2.bioinspired
+(Benoit et al., 2010): photoreceptors local adaptation, photoreceptors and
+horizontal cells spatio-temporal low pass filters, ON/OFF bipolar cells,
+local adaptation of the parvo ganglion cells and the amacrine high pass
+filter of the magno channel. All filters work on the last two axes, so any
+leading axes (channels, streams) are processed in a vectorized way.
+
+Color frames are processed channel by channel instead of with the color
+multiplexing of cv2.bioinspired, and the magno channel is fed with the
+mean of the ON/OFF bipolar outputs across channels. The outputs are
+therefore not bit exact. With the default setup, the correlation
+coefficients with the OpenCV backend on the bundled Horse Riding video,
+skipping the first 5 frames of convergence, are:
+
+    size, frames          parvo gray  parvo color  magno gray  magno color
+    160x120, 15 (tests)   0.95        0.92         0.94        0.93
+    320x240 (native), 30  0.96        0.86         0.91        0.90
+
+The agreement of the color parvo output drops at the native resolution,
+see tests/test_numpy_retina.py for the resized setup.
+
+The spatial filters are banded matrix products (see lp_filter). The
+OpenCV backend spreads its filters over the CPU cores while only the
+matrix products of this one are multi-threaded (by the BLAS library), so
+expect OpenCV to be faster on several cores. script/benchmark.py reports
+the throughput of both backends ("get_opl_frame" and
+"get_opl_frame_numpy") on the machine it runs on.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import numpy as np
+
+MAX_INPUT_VALUE = 255.
+
+# the longest axis filtered by a matrix product, see lp_filter
+MAX_MATRIX_LENGTH = 2048
+# the shortest block of a banded matrix product, see matrix_filter
+MIN_BLOCK_LENGTH = 32
+# the size of the input planes of a group of streams of a BatchRetina
+BATCH_GROUP_BYTES = 512*1024
+
+_filter_blocks = {}
+
+
+def lp_coefficients(beta, tau, k):
+    """Compute the coefficients of a spatio-temporal low pass filter.
+
+    Parameters
+    ----------
+    beta : float
+        gain of the filter
+    tau : float
+        temporal constant of the filter, unit is frames
+    k : float
+        spatial constant of the filter, unit is pixels
+
+    Returns
+    -------
+    coefficients : tuple
+        (a, gain, tau) of the recursive filter
+    """
+    beta = beta+tau
+    alpha = max(k, 0.001)**2
+    mu = 0.8
+    temp = (1.+beta)/(2.*mu*alpha)
+    a = 1.+temp-np.sqrt((1.+temp)**2-1.)
+    gain = (1.-a)**4/(1.+beta)
+
+    return (float(a), float(gain), float(tau))
+
+
+def recursive_filter(frame, a, axis, reverse=False):
+    """Run a first order recursive filter along an axis, in place.
+
+    The recursion y[n] = x[n]+a*y[n-1] is computed as a scan: after the
+    step of shift s every output holds the 2s latest inputs, so the
+    filter takes log2(n) vectorized steps instead of a Python loop over
+    the n rows or columns. The steps stop once a**s no longer changes a
+    float32 output.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        the input, replaced by the output
+    a : float
+        the coefficient of the filter, between 0 and 1
+    axis : int
+        the axis of the recursion
+    reverse : bool
+        run the recursion from the end of the axis (anticausal) if True
+
+    Returns
+    -------
+    frame : numpy.ndarray
+        the filtered frame
+    """
+    length = frame.shape[axis]
+    head = [slice(None)]*frame.ndim
+    tail = [slice(None)]*frame.ndim
+
+    shift = 1
+    coef = a
+    while shift < length and coef > 1e-8:
+        if reverse is True:
+            head[axis] = slice(None, -shift)
+            tail[axis] = slice(shift, None)
+        else:
+            head[axis] = slice(shift, None)
+            tail[axis] = slice(None, -shift)
+        frame[tuple(head)] += coef*frame[tuple(tail)]
+        shift *= 2
+        coef *= coef
+
+    return frame
+
+
+def filter_matrix(a, length):
+    """Get the matrix of a causal then anticausal recursive filter.
+
+    The filters are linear, so both passes along an axis of the given
+    length are a single (length, length) matrix, output = matrix.input.
+
+    Parameters
+    ----------
+    a : float
+        the coefficient of the filter, between 0 and 1
+    length : int
+        the length of the filtered axis
+
+    Returns
+    -------
+    matrix : numpy.ndarray
+        the float32 filter matrix
+    """
+    matrix = np.eye(length)
+    recursive_filter(matrix, a, 0)
+    recursive_filter(matrix, a, 0, reverse=True)
+
+    return matrix.astype(np.float32)
+
+
+def filter_blocks(a, length, axis):
+    """Get the blocks of the filter matrix applied by matrix_filter.
+
+    The weight of a pixel at distance d is a**d relative to the centre,
+    so the filter matrix is a band of half width log(1e-7)/log(a). Long
+    axes are cut in blocks and each block only keeps its band. The
+    blocks are cached.
+
+    Parameters
+    ----------
+    a : float
+        the coefficient of the filter, between 0 and 1
+    length : int
+        the length of the filtered axis
+    axis : int
+        -1 to filter the rows, -2 to filter the columns
+
+    Returns
+    -------
+    blocks : list
+        (start, stop, low, high, block) tuples, output[start:stop] is
+        block.input[low:high] for the columns, input[low:high].block for
+        the rows
+    """
+    key = (a, length, axis)
+    blocks = _filter_blocks.get(key)
+    if blocks is not None:
+        return blocks
+
+    matrix = filter_matrix(a, length)
+    if 0 < a < 1e-7**(1./length):
+        band = int(np.ceil(np.log(1e-7)/np.log(a)))
+    else:
+        band = length
+    block_length = max(2*band, MIN_BLOCK_LENGTH)
+
+    blocks = []
+    for start in range(0, length, block_length):
+        stop = min(start+block_length, length)
+        low, high = max(start-band, 0), min(stop+band, length)
+        block = matrix[start:stop, low:high]
+        if axis == -1:
+            block = block.T
+        blocks.append((start, stop, low, high, np.ascontiguousarray(block)))
+    _filter_blocks[key] = blocks
+
+    return blocks
+
+
+def matrix_filter(frame, a, axis, out):
+    """Run a causal then anticausal recursive filter as a matrix product.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        input of shape (..., H, W)
+    a : float
+        the coefficient of the filter, between 0 and 1
+    axis : int
+        -1 to filter the rows, -2 to filter the columns
+    out : numpy.ndarray
+        the output, it can not be frame
+
+    Returns
+    -------
+    out : numpy.ndarray
+        the filtered frame
+    """
+    for start, stop, low, high, block in filter_blocks(
+            a, frame.shape[axis], axis):
+        if axis == -1:
+            np.matmul(frame[..., low:high], block, out=out[..., start:stop])
+        else:
+            np.matmul(block, frame[..., low:high, :],
+                      out=out[..., start:stop, :])
+
+    return out
+
+
+def lp_filter(frame, state, coefficients):
+    """Run a spatio-temporal low pass filter on the last two axes.
+
+    The filter is a first order recursive filter applied causally and
+    anticausally on rows then columns, the temporal memory is held by the
+    output buffer. The spatial passes are banded matrix products, see
+    filter_blocks, which run in BLAS instead of a Python loop over the
+    rows and columns. Axes longer than MAX_MATRIX_LENGTH are filtered by
+    recursive_filter.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        input of shape (..., H, W)
+    state : numpy.ndarray
+        output of the previous step, updated in place
+    coefficients : tuple
+        the coefficients from lp_coefficients
+
+    Returns
+    -------
+    state : numpy.ndarray
+        the filtered frame
+    """
+    a, gain, tau = coefficients
+    height, width = state.shape[-2:]
+
+    # the temporal memory is added to the input of the horizontal
+    # causal filter
+    if tau != 0:
+        frame = frame+tau*state
+
+    if width <= MAX_MATRIX_LENGTH:
+        frame = matrix_filter(frame, a, -1, np.empty_like(state))
+    else:
+        frame = np.array(frame, dtype=state.dtype)
+        recursive_filter(frame, a, -1)
+        recursive_filter(frame, a, -1, reverse=True)
+
+    if height <= MAX_MATRIX_LENGTH:
+        matrix_filter(frame, a, -2, state)
+    else:
+        recursive_filter(frame, a, -2)
+        recursive_filter(frame, a, -2, reverse=True)
+        state[...] = frame
+    state *= gain
+
+    return state
+
+
+def local_adaptation(frame, local_luminance, v0,
+                     max_value=MAX_INPUT_VALUE):
+    """Michaelis-Menten like compression driven by the local luminance.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        the input frame
+    local_luminance : numpy.ndarray
+        the local luminance of the frame
+    v0 : float
+        the compression strength, between 0 and 1
+    max_value : float
+        the maximum input value
+
+    Returns
+    -------
+    new_frame : numpy.ndarray
+        the compressed frame
+    """
+    # in place on two buffers, the function runs on every pixel thrice
+    # per step
+    x0 = local_luminance*v0
+    x0 += max_value*(1.-v0)
+    new_frame = x0+max_value
+    new_frame *= frame
+    x0 += frame
+    x0 += 1e-11
+    new_frame /= x0
+
+    return new_frame
+
+
+def normalise_output(frame, num_axes, max_value=255.):
+    """Rescale the frame between 0 and max_value.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        the frame, normalised in place
+    num_axes : int
+        number of trailing axes that make a frame, leading axes are
+        normalised independently
+    max_value : float
+        the maximum output value
+
+    Returns
+    -------
+    frame : numpy.ndarray
+        the normalised frame
+    """
+    axes = tuple(range(frame.ndim-num_axes, frame.ndim))
+    min_value = frame.min(axis=axes, keepdims=True)
+    range_value = frame.max(axis=axes, keepdims=True)-min_value
+    range_value[range_value == 0] = 1.
+
+    frame -= min_value
+    frame *= max_value/range_value
+
+    return frame
+
+
+# attributes that define the setup of a NumpyRetina, see getState
+STATE_SETUP_KEYS = ("size", "use_parvo", "use_magno", "color_mode",
+                    "normalise_parvo", "photoreceptors_v0", "ganglion_v0",
+                    "photoreceptors_coef", "hcells_coef", "ganglion_coef",
+                    "normalise_magno", "magno_v0", "amacrine_coef",
+                    "parasol_coef", "magno_local_coef")
+
+
+class NumpyRetina(object):
+    """A retina model driven by NumPy.
+
+    The class provides the methods of cv2.bioinspired_Retina used by the
+    retina module (run, getParvo, getMagno, clearBuffers, the setup
+    functions...), so it can be used in place of an OpenCV retina.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the retina receptive field (height, width)
+    """
+
+    # the magno channel is fed by the bipolar cells directly, so the
+    # parvo channel can be switched off for magno only outputs
+    magno_needs_parvo = False
+
+    def __init__(self, size):
+        if len(size) != 2:
+            raise ValueError("Invalid size setting.")
+
+        self.size = (int(size[0]), int(size[1]))
+        self.use_parvo = True
+        self.use_magno = True
+
+        self.setupOPLandIPLParvoChannel()
+        self.setupIPLMagnoChannel()
+        self.clearBuffers()
+
+    def setupOPLandIPLParvoChannel(
+            self, colorMode=True, normaliseOutput=True,
+            photoreceptorsLocalAdaptationSensitivity=0.75,
+            photoreceptorsTemporalConstant=0.9,
+            photoreceptorsSpatialConstant=0.53, horizontalCellsGain=0.01,
+            HcellsTemporalConstant=0.5, HcellsSpatialConstant=7.,
+            ganglionCellsSensitivity=0.75):
+        """Set up the OPL and IPL parvo channel, see create_para_dict."""
+        self.color_mode = bool(colorMode)
+        self.normalise_parvo = bool(normaliseOutput)
+        self.photoreceptors_v0 = photoreceptorsLocalAdaptationSensitivity
+        self.ganglion_v0 = ganglionCellsSensitivity
+
+        self.photoreceptors_coef = lp_coefficients(
+            0., photoreceptorsTemporalConstant,
+            photoreceptorsSpatialConstant)
+        self.hcells_coef = lp_coefficients(
+            horizontalCellsGain, HcellsTemporalConstant,
+            HcellsSpatialConstant)
+        self.ganglion_coef = lp_coefficients(
+            0., photoreceptorsTemporalConstant,
+            photoreceptorsSpatialConstant)
+
+    def setupIPLMagnoChannel(
+            self, normaliseOutput=True, parasolCells_beta=0.,
+            parasolCells_tau=0., parasolCells_k=7.,
+            amacrinCellsTemporalCutFrequency=2., V0CompressionParameter=0.95,
+            localAdaptintegration_tau=0., localAdaptintegration_k=7.):
+        """Set up the IPL magno channel, see create_para_dict."""
+        self.normalise_magno = bool(normaliseOutput)
+        self.magno_v0 = V0CompressionParameter
+        self.amacrine_coef = float(
+            np.exp(-1./amacrinCellsTemporalCutFrequency))
+
+        self.parasol_coef = lp_coefficients(
+            parasolCells_beta, parasolCells_tau, parasolCells_k)
+        self.magno_local_coef = lp_coefficients(
+            0., localAdaptintegration_tau, localAdaptintegration_k)
+
+    def clearBuffers(self):
+        """Clear the temporal state of all filters."""
+        self._state = None
+        self._parvo = None
+        self._magno = None
+
+    def _init_state(self, shape):
+        """Allocate the filter buffers for inputs of shape (..., H, W)."""
+        # magno works on the mean across channels
+        magno_shape = (2,)+shape[:-3]+shape[-2:]
+
+        self._state = {}
+        self._state["shape"] = shape
+        self._state["photoreceptors"] = np.zeros(shape, np.float32)
+        self._state["hcells"] = np.zeros(shape, np.float32)
+        self._state["ganglion_local"] = np.zeros((2,)+shape, np.float32)
+        self._state["bipolar_prev"] = np.zeros(magno_shape, np.float32)
+        self._state["amacrine"] = np.zeros(magno_shape, np.float32)
+        self._state["magno_x"] = np.zeros(magno_shape, np.float32)
+        self._state["magno_local"] = np.zeros(magno_shape, np.float32)
+
+    def _step(self, planes):
+        """Run one time step on inputs of shape (..., C, H, W)."""
+        if self._state is None or self._state["shape"] != planes.shape:
+            self._init_state(planes.shape)
+
+        parvo, magno = self._process(planes, self._state)
+        if parvo is not None:
+            self._parvo = parvo
+        if magno is not None:
+            self._magno = magno
+
+    def _process(self, planes, state):
+        """Run one time step on the given filter buffers.
+
+        Returns
+        -------
+        outputs : tuple
+            the float (parvo, magno) outputs, None for an inactive channel
+        """
+        parvo = None
+        magno = None
+
+        # photoreceptors local adaptation, driven by the pixel luminance
+        adapted = local_adaptation(planes, planes, self.photoreceptors_v0)
+
+        # outer plexiform layer
+        photoreceptors = lp_filter(adapted, state["photoreceptors"],
+                                   self.photoreceptors_coef)
+        hcells = lp_filter(photoreceptors, state["hcells"],
+                           self.hcells_coef)
+
+        # ON and OFF bipolar cells
+        bipolar = np.empty((2,)+planes.shape, np.float32)
+        np.subtract(photoreceptors, hcells, out=bipolar[0])
+        np.negative(bipolar[0], out=bipolar[1])
+        np.maximum(bipolar, 0, out=bipolar)
+
+        if self.use_parvo is True:
+            ganglion_local = lp_filter(bipolar, state["ganglion_local"],
+                                       self.ganglion_coef)
+            parvo_on_off = local_adaptation(bipolar, ganglion_local,
+                                            self.ganglion_v0)
+            parvo = parvo_on_off[0]-parvo_on_off[1]
+
+            # centred sigmoid then zero mean, unit variance per frame
+            parvo = MAX_INPUT_VALUE*parvo/(np.abs(parvo)+MAX_INPUT_VALUE)
+            axes = (-3, -2, -1)
+            parvo -= parvo.mean(axis=axes, keepdims=True)
+            std = parvo.std(axis=axes, keepdims=True)
+            std[std == 0] = 1.
+            parvo /= std
+            if self.normalise_parvo is True:
+                normalise_output(parvo, 3)
+
+        if self.use_magno is True:
+            magno_bipolar = bipolar.mean(axis=-3)
+
+            # amacrine cells temporal high pass filter
+            amacrine = state["amacrine"]
+            amacrine += magno_bipolar
+            amacrine -= state["bipolar_prev"]
+            amacrine *= self.amacrine_coef
+            np.maximum(amacrine, 0, out=amacrine)
+            state["bipolar_prev"][...] = magno_bipolar
+
+            # parasol cells and their local adaptation
+            magno_x = lp_filter(amacrine, state["magno_x"],
+                                self.parasol_coef)
+            magno_local = lp_filter(magno_x, state["magno_local"],
+                                    self.magno_local_coef)
+            magno_x[...] = local_adaptation(magno_x, magno_local,
+                                            self.magno_v0)
+
+            magno = magno_x[0]+magno_x[1]
+            # near zero centred sigmoid
+            magno = magno**3
+            magno = MAX_INPUT_VALUE*magno/(magno+40.**3)
+            if self.normalise_magno is True:
+                normalise_output(magno, 2)
+
+        return parvo, magno
+
+    def _to_planes(self, frame):
+        """Convert (H, W) or (H, W, C) frames to (C, H, W) planes."""
+        frame = np.asarray(frame, dtype=np.float32)
+
+        if frame.ndim == 2:
+            return frame[np.newaxis]
+        if self.color_mode is False:
+            # BGR to gray
+            return np.dot(frame, np.array([0.114, 0.587, 0.299],
+                                          np.float32))[np.newaxis]
+        # RGB planes as the OpenCV retina
+        return np.ascontiguousarray(np.rollaxis(frame[..., ::-1], -1))
+
+    def run(self, frame):
+        """Run the retina on a frame.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            a gray (H, W) or BGR (H, W, 3) frame
+        """
+        if frame.shape[:2] != self.size:
+            raise ValueError("The frame does not fit the retina.")
+
+        self._step(self._to_planes(frame))
+
+    def getParvoRAW(self):
+        """Get the float parvo output as a flat planar (RGB) column."""
+        return self._parvo.reshape(-1, 1)
+
+    def getMagnoRAW(self):
+        """Get the float magno output as a flat column."""
+        return self._magno.reshape(-1, 1)
+
+    def getParvo(self):
+        """Get the 8-bit parvo frame, BGR if the input was colored."""
+        parvo = np.clip(np.rint(self._parvo), 0, 255).astype(np.uint8)
+        if parvo.shape[0] == 1:
+            return parvo[0]
+        return np.ascontiguousarray(np.rollaxis(parvo[::-1], 0, 3))
+
+    def getMagno(self):
+        """Get the 8-bit magno frame."""
+        return np.clip(np.rint(self._magno), 0, 255).astype(np.uint8)
+
+    def getInputSize(self):
+        """Get the input size (width, height) as a retina does."""
+        return (self.size[1], self.size[0])
+
+    def getOutputSize(self):
+        """Get the output size (width, height) as a retina does."""
+        return (self.size[1], self.size[0])
+
+    def activateContoursProcessing(self, activate):
+        """Activate or deactivate the parvo channel."""
+        self.use_parvo = bool(activate)
+
+    def activateMovingContoursProcessing(self, activate):
+        """Activate or deactivate the magno channel."""
+        self.use_magno = bool(activate)
+
+    def getState(self):
+        """Get the setup and the temporal state as a dictionary of arrays.
+
+        The keys are prefixed by "setup_", "state_" or "output_", so the
+        dictionary can be stored with numpy.savez and restored by
+        setState.
+        """
+        state = {}
+        for key in STATE_SETUP_KEYS:
+            state["setup_"+key] = np.asarray(getattr(self, key))
+
+        if self._state is not None:
+            for key, value in self._state.items():
+                state["state_"+key] = np.asarray(value)
+        if self._parvo is not None:
+            state["output_parvo"] = self._parvo
+        if self._magno is not None:
+            state["output_magno"] = self._magno
+
+        return state
+
+    def setState(self, state):
+        """Restore the setup and the temporal state given by getState."""
+        for key in STATE_SETUP_KEYS:
+            value = np.asarray(state["setup_"+key])
+            if value.ndim == 0:
+                value = value.item()
+            else:
+                value = tuple(value.tolist())
+            setattr(self, key, value)
+
+        self.clearBuffers()
+        if "state_shape" in state:
+            self._state = {}
+            for key in state:
+                if key.startswith("state_"):
+                    self._state[key[6:]] = np.array(state[key])
+            self._state["shape"] = tuple(self._state["shape"].tolist())
+        if "output_parvo" in state:
+            self._parvo = np.array(state["output_parvo"])
+        if "output_magno" in state:
+            self._magno = np.array(state["output_magno"])
+
+
+class BatchRetina(NumpyRetina):
+    """A retina model that runs B independent streams in lockstep.
+
+    All streams share the same size and setup, each stream keeps its own
+    temporal state. A step processes a (B, H, W) or (B, H, W, 3) batch of
+    frames with one set of vectorized operations per group of streams.
+    The filters dominate the cost of a step from small frames on, so the
+    batch runs about as fast as a loop of get_opl_frame over B retinas
+    of either backend, it saves the bookkeeping of B retinas rather than
+    time. script/benchmark.py compares it with both loops.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the retina receptive field (height, width)
+    num_streams : int
+        number of streams B
+    """
+
+    # axis of the streams in the filter buffers
+    _STREAM_AXES = {"photoreceptors": 0, "hcells": 0, "ganglion_local": 1,
+                    "bipolar_prev": 1, "amacrine": 1, "magno_x": 1,
+                    "magno_local": 1}
+
+    def __init__(self, size, num_streams):
+        if num_streams < 1:
+            raise ValueError("The batch should contain at least one stream.")
+
+        self.num_streams = int(num_streams)
+        super(BatchRetina, self).__init__(size)
+
+    def clearBuffers(self, stream=None):
+        """Clear the temporal state of all or of a single stream.
+
+        Parameters
+        ----------
+        stream : int
+            index of the stream to clear, all streams if None
+        """
+        if stream is None or self._state is None:
+            super(BatchRetina, self).clearBuffers()
+            return
+
+        for key, axis in self._STREAM_AXES.items():
+            self._state[key][(slice(None),)*axis+(stream,)] = 0.
+
+    def _step(self, planes):
+        """Run one time step, a group of streams at a time.
+
+        The per-stream cost of the filters does not shrink with the batch
+        while their buffers outgrow the CPU cache, so the streams are
+        processed in groups of about BATCH_GROUP_BYTES of input planes.
+        """
+        if self._state is None or self._state["shape"] != planes.shape:
+            self._init_state(planes.shape)
+
+        group_size = max(BATCH_GROUP_BYTES//planes[0].nbytes, 1)
+        if group_size >= self.num_streams:
+            super(BatchRetina, self)._step(planes)
+            return
+
+        outputs = []
+        for start in range(0, self.num_streams, group_size):
+            streams = slice(start, start+group_size)
+            state = dict((key, self._state[key][(slice(None),)*axis +
+                                                (streams,)])
+                         for key, axis in self._STREAM_AXES.items())
+            outputs.append(self._process(planes[streams], state))
+
+        parvo, magno = zip(*outputs)
+        if parvo[0] is not None:
+            self._parvo = np.concatenate(parvo)
+        if magno[0] is not None:
+            self._magno = np.concatenate(magno)
+
+    def _to_planes(self, frames):
+        """Convert (B, H, W) or (B, H, W, C) frames to (B, C, H, W)."""
+        frames = np.asarray(frames, dtype=np.float32)
+
+        if frames.ndim == 3:
+            return frames[:, np.newaxis]
+        if self.color_mode is False:
+            # BGR to gray
+            return np.dot(frames, np.array([0.114, 0.587, 0.299],
+                                           np.float32))[:, np.newaxis]
+        return np.ascontiguousarray(frames[..., ::-1].transpose(0, 3, 1, 2))
+
+    def run(self, frames):
+        """Run the retina on a batch of frames.
+
+        Parameters
+        ----------
+        frames : numpy.ndarray
+            a batch of gray (B, H, W) or BGR (B, H, W, 3) frames
+        """
+        if frames.shape[0] != self.num_streams or \
+                frames.shape[1:3] != self.size:
+            raise ValueError("The frames do not fit the batch retina.")
+
+        self._step(self._to_planes(frames))
+
+    def getParvo(self):
+        """Get the 8-bit parvo frames, (B, H, W, 3) for colored inputs."""
+        parvo = np.clip(np.rint(self._parvo), 0, 255).astype(np.uint8)
+        if parvo.shape[1] == 1:
+            return parvo[:, 0]
+        return np.ascontiguousarray(parvo[:, ::-1].transpose(0, 2, 3, 1))
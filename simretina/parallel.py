@@ -0,0 +1,723 @@
+"""Parallel processing engines for the retina model.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import itertools
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import numpy as np
+
+from simretina import dataset, retina
+from simretina.numpy_retina import normalise_output
+
+# half width in pixels of the band around the seams of the tiles on which
+# the gains of the tiles are matched, the outputs of a tile drift from the
+# full frame ones in its halo, so only the pixels next to the seam are used
+TILE_MATCH_BAND = 2
+
+# retina pool owned by each worker process
+_worker_pool = None
+
+
+def _get_worker_retina(size, para_dict):
+    """Get a cleared retina from the pool of the current process."""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = retina.RetinaPool()
+
+    return _worker_pool.get(size, para_dict)
+
+
+def _process_video(vid_path, para_dict, color, get_parvo, get_magno,
+                   color_mode, process_fn):
+    """Run the retina on a single video inside a worker."""
+    frames = dataset.get_video(vid_path, color=color, size=False)
+    eye = _get_worker_retina(frames[0].shape[:2], para_dict)
+
+    outputs = retina.get_opl_frames(eye, frames, get_parvo=get_parvo,
+                                    get_magno=get_magno, reopen_eye=False,
+                                    color_mode=color_mode, stack=True)
+
+    if process_fn is not None:
+        return process_fn(outputs)
+    return outputs
+
+
+def process_videos(vid_paths, para_dict=None, max_workers=None,
+                   max_in_flight=None, color=True, get_parvo=True,
+                   get_magno=True, color_mode="color", process_fn=None):
+    """Process many videos concurrently on a process pool.
+
+    Every worker process owns its retinas, videos are submitted lazily so
+    that at most max_in_flight of them are decoded or processed at the
+    same time. A failing video does not stop the others, its error is
+    reported in place of the outputs.
+
+    Parameters
+    ----------
+    vid_paths : iterable
+        paths of the videos
+    para_dict : dictionary
+        a given retina dictionary, or None for the default setup
+    max_workers : int
+        number of worker processes, number of cores if None
+    max_in_flight : int
+        maximum number of submitted but not yet returned videos,
+        twice the number of workers if None
+    color : bool
+        read color frames if True, gray frames if False
+    get_parvo : bool
+        return parvo frames if True, otherwise False
+    get_magno : bool
+        return magno frames if True, otherwise False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+    process_fn : callable
+        picklable function applied in the worker on the stacked outputs
+        of get_opl_frames, its return value is sent back instead of the
+        frames (e.g. for saving results or computing summaries)
+
+    Yields
+    ------
+    vid_path : string
+        path of the processed video, in order of completion
+    outputs : tuple or numpy.ndarray or object
+        stacked parvo and/or magno frames, or the return value of
+        process_fn, None if the video failed
+    error : Exception
+        the error raised while processing the video, None on success
+    """
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 2*max_workers
+    if max_in_flight < 1:
+        raise ValueError("At least one video should be in flight.")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        vid_paths = iter(vid_paths)
+        in_flight = {}
+
+        while True:
+            for vid_path in vid_paths:
+                future = executor.submit(_process_video, vid_path,
+                                         para_dict, color, get_parvo,
+                                         get_magno, color_mode, process_fn)
+                in_flight[future] = vid_path
+                if len(in_flight) >= max_in_flight:
+                    break
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                vid_path = in_flight.pop(future)
+                try:
+                    outputs, error = future.result(), None
+                except Exception as vid_error:
+                    outputs, error = None, vid_error
+                yield vid_path, outputs, error
+
+
+def _as_channels(outputs, get_parvo, get_magno):
+    """Put the outputs of get_opl_frames in a list of channels."""
+    if get_parvo is True and get_magno is True:
+        return list(outputs)
+    return [outputs]
+
+
+def _from_channels(channels):
+    """Inverse of _as_channels."""
+    if len(channels) == 1:
+        return channels[0]
+    return tuple(channels)
+
+
+def _get_memmap_source(frames):
+    """Describe a file-backed array so that a worker can map it again.
+
+    Returns
+    -------
+    source : tuple
+        (file_path, dtype, offset, shape) for numpy.memmap, None if
+        frames is not a C-contiguous view of a file mapped by numpy
+    """
+    mapped = frames
+    while isinstance(mapped, np.memmap) and \
+            not isinstance(mapped.base, mmap.mmap):
+        mapped = mapped.base
+    if not isinstance(mapped, np.memmap) or mapped.filename is None or \
+            not frames.flags.c_contiguous:
+        return None
+
+    offset = mapped.offset+frames.ctypes.data-mapped.ctypes.data
+    return (mapped.filename, frames.dtype.str, offset, frames.shape)
+
+
+def _process_chunk(frames, warmup_len, probe_len, para_dict, get_parvo,
+                   get_magno, color_mode):
+    """Run the retina on a warm-up prefixed chunk inside a worker."""
+    if isinstance(frames, tuple):
+        # rows of a memory map, see _get_memmap_source
+        file_path, dtype, offset, shape, start, end = frames
+        frames = np.memmap(file_path, dtype=dtype, mode="r", offset=offset,
+                           shape=shape)[start:end]
+
+    if isinstance(frames, dataset.Video):
+        size = frames.shape[:2]
+    else:
+        size = frames[0].shape[:2]
+    eye = _get_worker_retina(size, para_dict)
+
+    outputs = retina.get_opl_frames(eye, frames, get_parvo=get_parvo,
+                                    get_magno=get_magno, reopen_eye=False,
+                                    color_mode=color_mode, stack=True)
+    if isinstance(frames, dataset.Video):
+        frames.close()
+
+    # drop the warm-up outputs, split the probe frames
+    end = len(frames)-probe_len
+    return [(channel[warmup_len:end], channel[end:])
+            for channel in _as_channels(outputs, get_parvo, get_magno)]
+
+
+def get_opl_frames_chunked(frames, para_dict=None, num_chunks=None,
+                           warmup_frames=10, probe_frames=5,
+                           max_workers=None, color=True, get_parvo=True,
+                           get_magno=True, color_mode="color"):
+    """Get parvo and magno frames of a long sequence in parallel chunks.
+
+    The sequence is split into num_chunks consecutive chunks which are
+    processed on separate workers. Since the retina is a temporal filter,
+    each chunk is first fed with the warmup_frames frames before it and
+    these outputs are discarded. The result approximates the sequential
+    output of get_opl_frames, the longer the warm-up the closer it gets.
+
+    To measure the approximation, each worker also processes probe_frames
+    frames past the end of its chunk, which are compared against the warm
+    started outputs of the next chunk. For the first boundary this is the
+    exact deviation from the sequential output, for later boundaries it
+    is the deviation introduced by restarting the retina there.
+
+    The frames do not have to fit in memory: for a video path or a
+    dataset.Video every worker decodes its own range of the video, and
+    for a memory-mapped array (e.g. from dataset.get_cached_video) every
+    worker maps its own rows. Only a list or an in-memory array is
+    pickled to the workers chunk by chunk. In all cases the parent holds
+    the stacked outputs, N*H*W*3 bytes for color parvo frames and N*H*W
+    bytes for magno frames, plus the outputs of one chunk at a time.
+
+    Parameters
+    ----------
+    frames : list, numpy.ndarray, dataset.Video or string
+        the frames, an array of frames (which can be a numpy.memmap), a
+        lazy video or a video path
+    para_dict : dictionary
+        a given retina dictionary, or None for the default setup
+    num_chunks : int
+        number of chunks, number of workers if None
+    warmup_frames : int
+        number of frames used to warm up each chunk
+    probe_frames : int
+        number of frames used to measure the deviation at each boundary
+    max_workers : int
+        number of worker processes, number of cores if None
+    color : bool
+        decode color frames if True, gray frames if False,
+        only used when frames is a video path
+    get_parvo : bool
+        return parvo frames if True, otherwise False
+    get_magno : bool
+        return magno frames if True, otherwise False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+
+    Returns
+    -------
+    outputs : tuple or numpy.ndarray
+        stacked parvo and/or magno frames, as get_opl_frames(stack=True)
+    report : dictionary
+        "boundary_deviations": the mean absolute deviation per boundary,
+        "mean_deviation" and "max_deviation" over all probe frames
+    """
+    if isinstance(frames, str):
+        frames = dataset.Video(frames, color=color)
+    if len(frames) == 0:
+        raise ValueError("No video frame is entered")
+    if get_parvo is False and get_magno is False:
+        raise ValueError("At least one channel should be requested.")
+
+    memmap_source = None
+    if isinstance(frames, np.ndarray):
+        memmap_source = _get_memmap_source(frames)
+
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if num_chunks is None:
+        num_chunks = max_workers
+    num_chunks = max(1, min(num_chunks, len(frames)))
+
+    bounds = [len(frames)*idx//num_chunks for idx in range(num_chunks+1)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            warmup_start = max(0, start-warmup_frames)
+            probe_end = min(len(frames), end+probe_frames)
+            if memmap_source is not None:
+                chunk = memmap_source+(warmup_start, probe_end)
+            else:
+                chunk = frames[warmup_start:probe_end]
+            futures.append(executor.submit(
+                _process_chunk, chunk,
+                start-warmup_start, probe_end-end, para_dict,
+                get_parvo, get_magno, color_mode))
+
+        channels = None
+        probes = []
+        for start, future in zip(bounds[:-1], futures):
+            chunk = future.result()
+            if channels is None:
+                channels = [np.empty((len(frames),)+main.shape[1:],
+                                     dtype=main.dtype)
+                            for main, _ in chunk]
+            for channel, (main, probe) in zip(channels, chunk):
+                channel[start:start+main.shape[0]] = main
+            probes.append([probe for _, probe in chunk])
+
+    boundary_deviations = []
+    max_deviation = 0.
+    for end, chunk_probes in zip(bounds[1:-1], probes[:-1]):
+        deviations = []
+        for channel, probe in zip(channels, chunk_probes):
+            if probe.shape[0] == 0:
+                continue
+            deviation = np.abs(
+                probe.astype(np.float32) -
+                channel[end:end+probe.shape[0]].astype(np.float32))
+            deviations.append(deviation.mean())
+            max_deviation = max(max_deviation, float(deviation.max()))
+        if deviations:
+            boundary_deviations.append(float(np.mean(deviations)))
+
+    report = {}
+    report["boundary_deviations"] = boundary_deviations
+    report["mean_deviation"] = float(np.mean(boundary_deviations)) \
+        if boundary_deviations else 0.
+    report["max_deviation"] = max_deviation
+
+    return _from_channels(channels), report
+
+
+def get_tile_halo(para_dict=None, halo_factor=3.):
+    """Get the halo margin needed around a tile.
+
+    The halo is sized from the largest spatial constant of the retina,
+    i.e. hcells_spatial_constant, parasol_cells_k and
+    local_adapt_integration_k.
+
+    Parameters
+    ----------
+    para_dict : dictionary
+        a given retina dictionary, or None for the default setup
+    halo_factor : float
+        number of spatial constants covered by the halo
+
+    Returns
+    -------
+    halo : int
+        the halo margin in pixels
+    """
+    if para_dict is None:
+        # default setup of cv2.bioinspired
+        spatial_constant = 7.
+    else:
+        spatial_constant = max(para_dict["hcells_spatial_constant"],
+                               para_dict["parasol_cells_k"],
+                               para_dict["local_adapt_integration_k"])
+
+    return int(np.ceil(halo_factor*spatial_constant))
+
+
+class TiledRetina(object):
+    """A retina that processes large frames in overlapping tiles.
+
+    The frame is split into tiles, each tile is extended by a halo margin
+    and processed by its own persistent retina in a thread pool. The
+    interiors of the tiles are then stitched back together. The class
+    provides run, getParvo, getMagno, getParvoRAW, getMagnoRAW,
+    getInputSize, getOutputSize, clearBuffers and the channel activation
+    methods so that it can be used in place of a retina with
+    get_opl_frame, get_opl_frames (also with raw=True) and
+    events.iter_events.
+
+    The output normalisation is done once on the stitched frame, so that
+    the tiles do not get different contrasts. The magno output of the
+    tiles is read unnormalised. The colored parvo output of an OpenCV
+    retina is clipped at 0 when it is not normalised, so the tiles
+    normalise their parvo output, which is an affine function of the
+    unnormalised one, and the affine gains of the tiles are matched
+    around their seams before stitching. The parvo output of a tile also
+    depends on the mean luminance of the tile, which the gains only
+    approximate, so expect a mean difference of a few grey levels with
+    the parvo output of a full frame retina.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the full frame (height, width)
+    tile_size : tuple
+        The size of the tile interiors (height, width)
+    para_dict : dictionary
+        a given retina dictionary, or None for the default setup
+    halo : int
+        the halo margin in pixels, see get_tile_halo if None
+    max_workers : int
+        number of threads, number of tiles if None
+    """
+
+    def __init__(self, size, tile_size=(512, 512), para_dict=None,
+                 halo=None, max_workers=None):
+        if len(size) != 2 or len(tile_size) != 2:
+            raise ValueError("Invalid size setting.")
+
+        if halo is None:
+            halo = get_tile_halo(para_dict)
+        if para_dict is None:
+            para_dict = retina.get_default_para_dict()
+
+        self.size = (int(size[0]), int(size[1]))
+        self.halo = halo
+        self.normalise_parvo = bool(para_dict["normalise_output_parvo"])
+        self.normalise_magno = bool(para_dict["normalise_output_magno"])
+
+        tile_para_dict = dict((key, para_dict[key])
+                              for key in retina.PARA_KEYS)
+        tile_para_dict["normalise_output_magno"] = False
+
+        self.tiles = []
+        for y0 in range(0, self.size[0], tile_size[0]):
+            for x0 in range(0, self.size[1], tile_size[1]):
+                y1 = min(y0+tile_size[0], self.size[0])
+                x1 = min(x0+tile_size[1], self.size[1])
+                # region processed by the tile retina
+                ey0, ey1 = max(0, y0-halo), min(self.size[0], y1+halo)
+                ex0, ex1 = max(0, x0-halo), min(self.size[1], x1+halo)
+
+                eye = retina.init_retina((ey1-ey0, ex1-ex0))
+                retina.apply_para_dict(eye, tile_para_dict)
+
+                self.tiles.append(((y0, y1, x0, x1), (ey0, ey1, ex0, ex1),
+                                   eye))
+
+        if max_workers is None:
+            max_workers = len(self.tiles)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self._parvo = None
+        self._magno = None
+        self.use_parvo = True
+        self.use_magno = True
+
+    def _run_tile(self, tile, frame):
+        """Run a tile retina and get copies of its float outputs."""
+        _, (ey0, ey1, ex0, ex1), eye = tile
+
+        eye.run(np.ascontiguousarray(frame[ey0:ey1, ex0:ex1]))
+        parvo, magno = retina.get_raw_frames(eye, self.use_parvo,
+                                             self.use_magno)
+        if parvo is not None:
+            parvo = parvo.copy()
+        if magno is not None:
+            magno = magno.copy()
+
+        return parvo, magno
+
+    def _match_gains(self, outputs):
+        """Get the affine gains that bring the tile outputs to one scale.
+
+        The gains (scale, offset) minimise the squared differences of the
+        scaled outputs of neighbouring tiles around their seams, see
+        TILE_MATCH_BAND, the gains of the first tile are (1, 0).
+        """
+        num_tiles = len(self.tiles)
+        normal = np.zeros((2*num_tiles, 2*num_tiles))
+        band = min(TILE_MATCH_BAND, self.halo)
+
+        for t_idx, u_idx in itertools.combinations(range(num_tiles), 2):
+            (ty0, ty1, tx0, tx1), t_ext, _ = self.tiles[t_idx]
+            (uy0, uy1, ux0, ux1), u_ext, _ = self.tiles[u_idx]
+            if (ty0, ty1) == (uy0, uy1) and tx1 == ux0:
+                y0, y1, x0, x1 = ty0, ty1, tx1-band, tx1+band
+            elif (tx0, tx1) == (ux0, ux1) and ty1 == uy0:
+                y0, y1, x0, x1 = ty1-band, ty1+band, tx0, tx1
+            else:
+                continue
+            # a small last tile may not cover the whole band
+            y1 = min(y1, t_ext[1], u_ext[1])
+            x1 = min(x1, t_ext[3], u_ext[3])
+
+            t_out = outputs[t_idx][y0-t_ext[0]:y1-t_ext[0],
+                                   x0-t_ext[2]:x1-t_ext[2]]
+            u_out = outputs[u_idx][y0-u_ext[0]:y1-u_ext[0],
+                                   x0-u_ext[2]:x1-u_ext[2]]
+
+            # residual scale_t*t_out+offset_t-scale_u*u_out-offset_u
+            terms = np.ones((t_out.size, 4))
+            terms[:, 0] = t_out.ravel()
+            terms[:, 2] = -u_out.ravel()
+            terms[:, 3] = -1.
+            idx = [2*t_idx, 2*t_idx+1, 2*u_idx, 2*u_idx+1]
+            normal[np.ix_(idx, idx)] += np.dot(terms.T, terms)
+
+        # the gains of the first tile are fixed to (1, 0)
+        gains = np.linalg.lstsq(normal[2:, 2:], -normal[2:, 0],
+                                rcond=None)[0]
+
+        return [(1., 0.)]+list(zip(gains[0::2], gains[1::2]))
+
+    def _stitch(self, outputs, normalise, gains=None):
+        """Stitch the float tile interiors and normalise them once."""
+        stitched = np.empty(self.size+outputs[0].shape[2:],
+                            dtype=np.float32)
+        for idx, ((y0, y1, x0, x1), (ey0, _, ex0, _), _) in enumerate(
+                self.tiles):
+            interior = outputs[idx][y0-ey0:y1-ey0, x0-ex0:x1-ex0]
+            if gains is not None:
+                scale, offset = gains[idx]
+                interior = scale*interior+offset
+            stitched[y0:y1, x0:x1] = interior
+
+        if normalise is True:
+            normalise_output(stitched, stitched.ndim)
+        return stitched
+
+    def run(self, frame):
+        """Run all tile retinas on a frame.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            a frame of the full size
+        """
+        if frame.shape[:2] != self.size:
+            raise ValueError("The frame does not fit the tiled retina.")
+
+        futures = [self.executor.submit(self._run_tile, tile, frame)
+                   for tile in self.tiles]
+        parvo_outputs, magno_outputs = zip(*[future.result()
+                                             for future in futures])
+
+        if self.use_parvo is True:
+            gains = None
+            if self.normalise_parvo is True and len(self.tiles) > 1 and \
+                    self.halo > 0:
+                gains = self._match_gains(parvo_outputs)
+            self._parvo = self._stitch(parvo_outputs, self.normalise_parvo,
+                                       gains)
+        if self.use_magno is True:
+            self._magno = self._stitch(magno_outputs, self.normalise_magno)
+
+    def getParvo(self):
+        """Get the stitched parvo frame of the last run."""
+        return np.clip(np.rint(self._parvo), 0, 255).astype(np.uint8)
+
+    def getMagno(self):
+        """Get the stitched magno frame of the last run."""
+        return np.clip(np.rint(self._magno), 0, 255).astype(np.uint8)
+
+    def getParvoRAW(self):
+        """Get the float parvo output of the last run as a retina does.
+
+        The output is flat, a colored output is in planar RGB order.
+        """
+        if self._parvo.ndim == 2:
+            return self._parvo.ravel().copy()
+        return self._parvo[..., ::-1].transpose(2, 0, 1).ravel()
+
+    def getMagnoRAW(self):
+        """Get the flat float magno output of the last run."""
+        return self._magno.ravel().copy()
+
+    def getInputSize(self):
+        """Get the input size (width, height) as a retina does."""
+        return (self.size[1], self.size[0])
+
+    def getOutputSize(self):
+        """Get the output size (width, height), same as the input size."""
+        return self.getInputSize()
+
+    def clearBuffers(self):
+        """Clear the buffers of all tile retinas."""
+        for _, _, eye in self.tiles:
+            eye.clearBuffers()
+
+    def activateContoursProcessing(self, activate):
+        """Activate or deactivate the parvo channel of all tiles."""
+        self.use_parvo = bool(activate)
+        for _, _, eye in self.tiles:
+            eye.activateContoursProcessing(activate)
+
+    def activateMovingContoursProcessing(self, activate):
+        """Activate or deactivate the magno channel of all tiles."""
+        self.use_magno = bool(activate)
+        for _, _, eye in self.tiles:
+            eye.activateMovingContoursProcessing(activate)
+
+    def close(self):
+        """Shut down the thread pool."""
+        self.executor.shutdown()
+
+
+def make_para_grid(para_dict, grid):
+    """Make all parameter combinations of a grid.
+
+    Parameters
+    ----------
+    para_dict : dictionary or RetinaParams
+        the base parameters
+    grid : dictionary
+        lists of values to try, keyed by parameter name
+
+    Returns
+    -------
+    candidates : list
+        a RetinaParams for every combination of the grid values
+    """
+    base_params = retina.freeze_para_dict(para_dict)
+    keys = sorted(grid.keys())
+
+    return [base_params.replace(**dict(zip(keys, values)))
+            for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def summarize_outputs(outputs, get_parvo=True, get_magno=True):
+    """Compute summary metrics of stacked retina outputs.
+
+    Parameters
+    ----------
+    outputs : tuple or numpy.ndarray
+        stacked parvo and/or magno frames, as get_opl_frames(stack=True)
+    get_parvo : bool
+        True if the outputs contain parvo frames
+    get_magno : bool
+        True if the outputs contain magno frames
+
+    Returns
+    -------
+    metrics : dictionary
+        mean, standard deviation and mean absolute temporal difference
+        of each channel, e.g. "magno_mean"
+    """
+    names = [name for name, requested in (("parvo", get_parvo),
+                                          ("magno", get_magno))
+             if requested is True]
+
+    metrics = {}
+    for name, channel in zip(names,
+                             _as_channels(outputs, get_parvo, get_magno)):
+        channel = channel.astype(np.float32)
+        metrics[name+"_mean"] = float(channel.mean())
+        metrics[name+"_std"] = float(channel.std())
+        metrics[name+"_temporal_diff"] = float(
+            np.abs(np.diff(channel, axis=0)).mean()) \
+            if channel.shape[0] > 1 else 0.
+
+    return metrics
+
+
+def _evaluate_candidate(frames_path, para_dict, get_parvo, get_magno,
+                        color_mode, metric_fn, store_outputs):
+    """Run the retina with one parameter candidate inside a worker."""
+    # rows of the memory map are shared with the other workers
+    frames = np.load(frames_path, mmap_mode="r")
+    eye = _get_worker_retina(frames.shape[1:3], para_dict)
+
+    outputs = retina.get_opl_frames(eye, list(frames), get_parvo=get_parvo,
+                                    get_magno=get_magno, reopen_eye=False,
+                                    color_mode=color_mode, stack=True)
+
+    if metric_fn is None:
+        metrics = summarize_outputs(outputs, get_parvo, get_magno)
+    else:
+        metrics = metric_fn(outputs)
+
+    if store_outputs is True:
+        return metrics, outputs
+    return metrics, None
+
+
+def sweep_params(frames, candidates, metric_fn=None, store_outputs=False,
+                 max_workers=None, color=True, get_parvo=True, get_magno=True,
+                 color_mode="color"):
+    """Evaluate many parameter candidates on one clip in parallel.
+
+    The clip is decoded once into a memory-mapped file that every worker
+    maps read-only, so the frames are shared through the page cache
+    instead of being decoded or copied per candidate.
+
+    Parameters
+    ----------
+    frames : list or string
+        a list of frames, or a video path
+    candidates : list
+        parameter dictionaries or RetinaParams, see make_para_grid
+    metric_fn : callable
+        picklable function that computes metrics from the stacked outputs
+        in the worker, summarize_outputs if None
+    store_outputs : bool
+        if True, also return the stacked outputs of every candidate
+    max_workers : int
+        number of worker processes, number of cores if None
+    color : bool
+        decode color frames if True, gray frames if False,
+        only used when frames is a video path
+    get_parvo : bool
+        compute parvo frames if True, otherwise False
+    get_magno : bool
+        compute magno frames if True, otherwise False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+
+    Returns
+    -------
+    results : list
+        (candidate, metrics, outputs) for every candidate in order,
+        outputs is None unless store_outputs is True
+    """
+    if isinstance(frames, str):
+        frames = dataset.get_video(frames, color=color, size=False)
+    if len(frames) == 0:
+        raise ValueError("No video frame is entered")
+
+    temp_dir = tempfile.mkdtemp(prefix="simretina-sweep-")
+    frames_path = os.path.join(temp_dir, "frames.npy")
+    try:
+        frames_map = np.lib.format.open_memmap(
+            frames_path, mode="w+", dtype=frames[0].dtype,
+            shape=(len(frames),)+frames[0].shape)
+        for idx, frame in enumerate(frames):
+            frames_map[idx] = frame
+        frames_map.flush()
+        del frames_map
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_evaluate_candidate, frames_path,
+                                       candidate, get_parvo, get_magno,
+                                       color_mode, metric_fn, store_outputs)
+                       for candidate in candidates]
+            results = [(candidate,)+future.result()
+                       for candidate, future in zip(candidates, futures)]
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return results
@@ -0,0 +1,359 @@
+"""Pipelined executor and live source runner.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import threading
+import time
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
+
+import cv2
+
+from simretina import dataset, retina
+
+# marks the end of a stream in the queues
+_END = object()
+
+
+def run_pipeline(eye, frames, process_fn=None, queue_size=8,
+                 get_parvo=True, get_magno=True, reopen_eye=True,
+                 color_mode="color", color=True):
+    """Run the retina in a three stage pipeline.
+
+    A decoder thread reads the frames, a retina thread runs get_opl_frame
+    and a post-processing thread applies process_fn. The stages are
+    joined by bounded queues. As OpenCV and ffmpeg release the GIL, the
+    stages overlap and the wall-clock time approaches the one of the
+    slowest stage.
+
+    Parameters
+    ----------
+    eye : cv2.bioinspired_Retina
+        the retina model
+    frames : iterable or string
+        an iterable of frames, or a video path that is decoded on demand
+    process_fn : callable
+        function applied on the outputs of get_opl_frame in the
+        post-processing thread (e.g. writing to disk), the outputs are
+        collected as is if None
+    queue_size : int
+        capacity of the queues between the stages
+    get_parvo : bool
+        return parvo frames if True, otherwise False
+    get_magno : bool
+        return magno frames if True, otherwise False
+    reopen_eye : bool
+        clear buffers if True, else False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+    color : bool
+        decode color frames if True, gray frames if False,
+        only used when frames is a video path
+
+    Returns
+    -------
+    results : list
+        the outputs, or the return values of process_fn, in frame order
+    stats : dictionary
+        "wall_time" of the run, and for each stage ("decode", "retina",
+        "post") its "busy" time, "utilization" and number of "frames"
+    """
+    if isinstance(frames, str):
+        frames = dataset.iter_video(frames, color=color)
+
+    decode_queue = Queue(maxsize=queue_size)
+    output_queue = Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    results = []
+    busy = {"decode": 0., "retina": 0., "post": 0.}
+    counts = {"decode": 0, "retina": 0, "post": 0}
+
+    def put(queue, item):
+        """Put an item unless the pipeline was stopped."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def get(queue):
+        """Get an item, or the end mark if the pipeline was stopped."""
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _END
+
+    def decode():
+        frame_iter = iter(frames)
+        while True:
+            start_time = time.time()
+            frame = next(frame_iter, _END)
+            busy["decode"] += time.time()-start_time
+            if frame is _END:
+                break
+            counts["decode"] += 1
+            if not put(decode_queue, frame):
+                return
+        put(decode_queue, _END)
+
+    def simulate():
+        if reopen_eye is True:
+            retina.clear_buffers(eye)
+        while True:
+            frame = get(decode_queue)
+            if frame is _END:
+                break
+            start_time = time.time()
+            outputs = retina.get_opl_frame(eye, frame, get_parvo=get_parvo,
+                                           get_magno=get_magno,
+                                           color_mode=color_mode)
+            busy["retina"] += time.time()-start_time
+            counts["retina"] += 1
+            if not put(output_queue, outputs):
+                return
+        put(output_queue, _END)
+
+    def post_process():
+        while True:
+            outputs = get(output_queue)
+            if outputs is _END:
+                break
+            start_time = time.time()
+            if process_fn is not None:
+                outputs = process_fn(outputs)
+            results.append(outputs)
+            busy["post"] += time.time()-start_time
+            counts["post"] += 1
+
+    def run_stage(stage_fn):
+        try:
+            stage_fn()
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+
+    threads = [threading.Thread(target=run_stage, args=(stage_fn,))
+               for stage_fn in (decode, simulate, post_process)]
+
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.time()-start_time
+
+    if errors:
+        raise errors[0]
+
+    stats = {"wall_time": wall_time}
+    for stage in ("decode", "retina", "post"):
+        stats[stage] = {
+            "busy": busy[stage],
+            "utilization": busy[stage]/wall_time if wall_time > 0 else 0.,
+            "frames": counts[stage]}
+
+    return results, stats
+
+
+class LiveSource(object):
+    """Keep only the newest frame of a live source.
+
+    A background thread reads the source as fast as it delivers frames.
+    A frame that is replaced before it is read is dropped, or merged into
+    the newest frame if merge is True so that the motion it carries still
+    reaches the retina. A frame that is older than the latency budget when
+    it is read is skipped, so the consumer always works on a recent frame
+    and the latency does not grow when the retina is slower than the
+    source.
+
+    Parameters
+    ----------
+    capture : cv2.VideoCapture
+        the live source, any object whose read() returns (ret, frame)
+    latency_budget : float
+        the maximum age of a frame in seconds when it is read
+    merge : bool
+        average the replaced frames into the newest frame if True,
+        otherwise drop them
+    """
+
+    def __init__(self, capture, latency_budget=0.1, merge=False):
+        self.capture = capture
+        self.latency_budget = latency_budget
+        self.merge = merge
+
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._frame = None
+        self._frame_time = None
+        self._num_merged = 0
+        self._read_time = None
+        self.ended = False
+
+        self.counts = {"grabbed": 0, "dropped": 0, "merged": 0,
+                       "skipped": 0, "processed": 0, "late": 0}
+        self._latency = 0.
+        self._start_time = None
+
+    def start(self):
+        """Start reading the source in the background."""
+        if self._thread is not None:
+            return
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._grab)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _grab(self):
+        """Read the source and keep the newest frame."""
+        while not self._stop.is_set():
+            ret, frame = self.capture.read()
+            now = time.time()
+            with self._lock:
+                if ret is False or frame is None:
+                    self.ended = True
+                    self._new_frame.notify_all()
+                    return
+                self.counts["grabbed"] += 1
+                if self._frame is not None and self.merge is True:
+                    # running mean of the frames since the last read
+                    self._num_merged += 1
+                    weight = 1./(self._num_merged+1)
+                    frame = cv2.addWeighted(self._frame, 1.-weight,
+                                            frame, weight, 0)
+                    self.counts["merged"] += 1
+                elif self._frame is not None:
+                    self.counts["dropped"] += 1
+                self._frame = frame
+                self._frame_time = now
+                self._new_frame.notify_all()
+
+    def read(self, timeout=1.):
+        """Get the newest frame that fits the latency budget.
+
+        Parameters
+        ----------
+        timeout : float
+            maximum waiting time in seconds
+
+        Returns
+        -------
+        frame : numpy.ndarray
+            the newest frame, None if no frame arrived in time or the
+            source ended
+        """
+        deadline = time.time()+timeout
+        with self._lock:
+            while True:
+                if self._frame is not None:
+                    frame, frame_time = self._frame, self._frame_time
+                    self._frame = None
+                    self._num_merged = 0
+                    if time.time()-frame_time <= self.latency_budget:
+                        self._read_time = frame_time
+                        return frame
+                    self.counts["skipped"] += 1
+                remaining = deadline-time.time()
+                if self.ended or remaining <= 0:
+                    return None
+                self._new_frame.wait(remaining)
+
+    def mark_done(self):
+        """Record that the last read frame was fully processed."""
+        if self._read_time is None:
+            return
+        latency = time.time()-self._read_time
+        self._read_time = None
+        self.counts["processed"] += 1
+        self._latency += latency
+        if latency > self.latency_budget:
+            self.counts["late"] += 1
+
+    def stats(self):
+        """Get the achieved frame rates, drop counts and mean latency.
+
+        Returns
+        -------
+        stats : dictionary
+            the "fps" of the processed frames, the "source_fps", the
+            "mean_latency" in seconds and the counts of "grabbed",
+            "dropped", "merged", "skipped" (too old), "processed" and
+            "late" (over the budget once processed) frames
+        """
+        with self._lock:
+            stats = dict(self.counts)
+        elapsed = 0. if self._start_time is None else \
+            time.time()-self._start_time
+        stats["fps"] = stats["processed"]/elapsed if elapsed > 0 else 0.
+        stats["source_fps"] = \
+            stats["grabbed"]/elapsed if elapsed > 0 else 0.
+        stats["mean_latency"] = self._latency/stats["processed"] \
+            if stats["processed"] > 0 else 0.
+
+        return stats
+
+    def release(self):
+        """Stop reading and release the source."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.capture.release()
+
+
+def run_live(eye, source, process_fn=None, max_frames=None, timeout=1.,
+             get_parvo=True, get_magno=True, color_mode="color"):
+    """Run the retina on the newest frames of a live source.
+
+    Parameters
+    ----------
+    eye : cv2.bioinspired_Retina
+        the retina model
+    source : LiveSource
+        the live source, started if needed
+    process_fn : callable
+        function applied on the outputs of get_opl_frame
+        (e.g. displaying them)
+    max_frames : int
+        stop after this number of processed frames, run until the source
+        ends if None
+    timeout : float
+        stop if no frame arrived within this time in seconds
+    get_parvo : bool
+        return parvo frames if True, otherwise False
+    get_magno : bool
+        return magno frames if True, otherwise False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+
+    Returns
+    -------
+    stats : dictionary
+        see LiveSource.stats
+    """
+    source.start()
+    num_frames = 0
+    while max_frames is None or num_frames < max_frames:
+        frame = source.read(timeout=timeout)
+        if frame is None:
+            break
+        outputs = retina.get_opl_frame(eye, frame, get_parvo=get_parvo,
+                                       get_magno=get_magno,
+                                       color_mode=color_mode)
+        if process_fn is not None:
+            process_fn(outputs)
+        source.mark_done()
+        num_frames += 1
+
+    return source.stats()
@@ -0,0 +1,209 @@
+"""Per-stage timing instrumentation.
+
+The retina, dataset and gui modules time their stages (decoding, retina
+run, parvo and magno conversion, gui conversion...) with stage(). The
+instrumentation is disabled by default, a disabled stage is a shared
+no-op context, so the cost is a function call and a flag check. Enable
+it by enable() or by setting the environment variable SIMRETINA_PROFILE,
+then read the counters and histograms by snapshot().
+
+    from simretina import profiling
+
+    profiling.enable()
+    ...
+    print(profiling.snapshot()["retina.run"])
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import bisect
+import json
+import os
+import threading
+from timeit import default_timer
+
+# upper edges of the histogram bins in seconds, from 1 us to ~16 s
+HISTOGRAM_EDGES = tuple(1e-6*2**idx for idx in range(25))
+
+_enabled = False
+_lock = threading.Lock()
+_stats = {}
+_dumper = None
+
+
+class _NullStage(object):
+    """A stage that does nothing, used when profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """Time a stage and record it on exit."""
+
+    __slots__ = ("name", "start_time")
+
+    def __init__(self, name):
+        self.name = name
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, default_timer()-self.start_time)
+        return False
+
+
+def enable():
+    """Enable the instrumentation."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Disable the instrumentation, the collected stats are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Check if the instrumentation is enabled."""
+    return _enabled
+
+
+def stage(name):
+    """Time a stage in a with block.
+
+    Parameters
+    ----------
+    name : string
+        the name of the stage, e.g. "retina.run"
+
+    Returns
+    -------
+    stage : context manager
+        records the duration of the block when the profiling is enabled
+    """
+    if _enabled is False:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def record(name, duration):
+    """Record a duration of a stage.
+
+    Parameters
+    ----------
+    name : string
+        the name of the stage
+    duration : float
+        the duration in seconds
+    """
+    bin_idx = min(bisect.bisect_left(HISTOGRAM_EDGES, duration),
+                  len(HISTOGRAM_EDGES)-1)
+
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = {"count": 0, "total": 0., "min": duration,
+                     "max": duration,
+                     "histogram": [0]*len(HISTOGRAM_EDGES)}
+            _stats[name] = stats
+        stats["count"] += 1
+        stats["total"] += duration
+        stats["min"] = min(stats["min"], duration)
+        stats["max"] = max(stats["max"], duration)
+        stats["histogram"][bin_idx] += 1
+
+
+def reset():
+    """Clear all collected stats."""
+    with _lock:
+        _stats.clear()
+
+
+def snapshot():
+    """Get a copy of the collected stats.
+
+    Returns
+    -------
+    stats : dictionary
+        for each stage, the "count" of calls, the "total", "mean", "min"
+        and "max" durations in seconds and the "histogram" of the
+        durations, the counts of the bins whose upper edges are
+        HISTOGRAM_EDGES
+    """
+    with _lock:
+        stats = dict((name, dict(stage_stats))
+                     for name, stage_stats in _stats.items())
+
+    for stage_stats in stats.values():
+        stage_stats["histogram"] = list(stage_stats["histogram"])
+        stage_stats["mean"] = stage_stats["total"]/stage_stats["count"]
+
+    return stats
+
+
+def dump(file_path):
+    """Write a snapshot to a JSON file."""
+    temp_path = file_path+".tmp"
+    with open(temp_path, "w") as dump_file:
+        json.dump({"histogram_edges": HISTOGRAM_EDGES,
+                   "stages": snapshot()}, dump_file, indent=2,
+                  sort_keys=True)
+    # replace the file at once so readers never see a partial dump,
+    # os.rename does not overwrite on Windows
+    if os.name == "nt" and os.path.exists(file_path):
+        os.remove(file_path)
+    os.rename(temp_path, file_path)
+
+
+def start_dump(file_path, interval=10.):
+    """Dump the snapshot to a JSON file periodically.
+
+    Parameters
+    ----------
+    file_path : string
+        the path of the JSON file
+    interval : float
+        the time between dumps in seconds
+    """
+    global _dumper
+    stop_dump()
+
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            dump(file_path)
+        dump(file_path)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    _dumper = (thread, stop)
+
+
+def stop_dump():
+    """Stop the periodic dump after a last dump."""
+    global _dumper
+    if _dumper is None:
+        return
+
+    thread, stop = _dumper
+    stop.set()
+    thread.join()
+    _dumper = None
+
+
+if os.environ.get("SIMRETINA_PROFILE"):
+    enable()
@@ -4,22 +4,252 @@ Author: Yuhuang Hu
 Email : yuhuang.hu@uzh.ch
 """
 
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import cv2
 import numpy as np
 from cv2 import bioinspired
 
+from simretina import dataset, profiling
+from simretina.numpy_retina import NumpyRetina, BatchRetina
+
+# parameters of the OPL and IPL parvo channel, in setup order
+PARVO_KEYS = ("color_mode",
+              "normalise_output_parvo",
+              "photoreceptors_local_adaptation_sensitivity",
+              "photoreceptors_temporal_constant",
+              "photoreceptors_spatial_constant",
+              "horizontal_cells_gain",
+              "hcells_temporal_constant",
+              "hcells_spatial_constant",
+              "ganglion_cells_sensitivity")
+
+# parameters of the IPL magno channel, in setup order
+MAGNO_KEYS = ("normalise_output_magno",
+              "parasol_cells_beta",
+              "parasol_cells_tau",
+              "parasol_cells_k",
+              "amacrin_cells_temporal_cut_frequency",
+              "v0_compression_parameter",
+              "local_adapt_integration_tau",
+              "local_adapt_integration_k")
+
+PARA_KEYS = PARVO_KEYS+MAGNO_KEYS
+
+# parameters in pixel unit, rescaled with the retina size
+SPATIAL_KEYS = ("photoreceptors_spatial_constant",
+                "hcells_spatial_constant",
+                "parasol_cells_k",
+                "local_adapt_integration_k")
+
+# rough number of float32 buffers a retina keeps per input pixel,
+# used to estimate the memory held by a RetinaPool
+RETINA_BUFFERS_PER_PIXEL = 40
+
+# back projection maps of foveated retinas, keyed by the init parameters
+_back_projection_maps = {}
 
-def init_retina(size):
+
+def init_retina(size, backend="opencv", reduction_factor=1.,
+                sampling_strength=10., scale=1.):
     """Initialize a retina by given parameters.
 
     Parameters
     ----------
     size : tuple
         The size of the retina receptive field (height, width)
+    backend : string
+        the retina implementation, the options are "opencv"
+        (cv2.bioinspired) and "numpy" (simretina.numpy_retina)
+    reduction_factor : float
+        if larger than 1, use the foveated (log sampling) retina of OpenCV
+        whose outputs are reduced by this factor, the centre keeps the
+        full resolution while the periphery is undersampled
+    sampling_strength : float
+        strength of the log scale of the foveated retina
+    scale : float
+        if smaller than 1, the retina runs at the size scaled by this
+        factor and its default spatial constants are scaled to match,
+        pass the same scale to get_opl_frame(s) to downsample the inputs.
+        A parameter set applied later has to be scaled by
+        scale_para_dict.
+    """
+    if len(size) != 2:
+        raise ValueError("Invalid size setting.")
+    if scale <= 0 or scale > 1:
+        raise ValueError("The scale has to be in (0, 1].")
+
+    size = get_scaled_size(size, scale)
+
+    if backend == "opencv" and reduction_factor > 1:
+        eye = bioinspired.createRetina(
+            (size[1], size[0]), True, bioinspired.RETINA_COLOR_BAYER,
+            True, reduction_factor, sampling_strength)
+    elif backend == "opencv":
+        eye = bioinspired.createRetina((size[1], size[0]))
+    elif backend == "numpy" and reduction_factor > 1:
+        raise ValueError("The numpy backend has no foveated mode.")
+    elif backend == "numpy":
+        eye = NumpyRetina(size)
+    else:
+        raise ValueError("Unsupported backend %s." % (backend))
+
+    if scale != 1:
+        apply_para_dict(eye, scale_para_dict(None, scale))
+
+    return eye
+
+
+def init_back_projection(size, reduction_factor, sampling_strength=10.):
+    """Get the maps that project the outputs of a foveated retina back.
+
+    The log sampling of OpenCV is radial, the centre is magnified and the
+    periphery is compressed, the sampled disc has the radius of the half
+    of the smaller side of the input. The distance to the centre of the
+    input pixel sampled by each output pixel is probed on a retina of the
+    same setup with Gray coded stripes, and the profile is inverted into
+    maps of cv2.remap. The maps are computed once per setup.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the retina receptive field (height, width), scaled as
+        in init_retina
+    reduction_factor : float
+        the reduction factor the retina was initialized with
+    sampling_strength : float
+        the sampling strength the retina was initialized with
+
+    Returns
+    -------
+    maps : tuple
+        (map_x, map_y), the float32 position in the sampled output of each
+        input pixel, -1 outside of the sampled disc
+    """
+    if len(size) != 2:
+        raise ValueError("Invalid size setting.")
+    if reduction_factor <= 1:
+        raise ValueError("The retina is not foveated.")
+
+    key = (int(size[0]), int(size[1]), float(reduction_factor),
+           float(sampling_strength))
+    maps = _back_projection_maps.get(key)
+    if maps is None:
+        maps = _probe_back_projection(key[:2], reduction_factor,
+                                      sampling_strength)
+        _back_projection_maps[key] = maps
+
+    return maps
+
+
+def _probe_back_projection(size, reduction_factor, sampling_strength):
+    """Probe the log sampling of a foveated retina, see
+    init_back_projection."""
+    height, width = size
+    eye = init_retina(size, reduction_factor=reduction_factor,
+                      sampling_strength=sampling_strength)
+    eye.setupOPLandIPLParvoChannel(colorMode=False)
+    out_width, out_height = eye.getOutputSize()
+
+    # the profile is radial, probe it on the central line of the longer
+    # side, each run tells on which side of a stripe edge the sampled
+    # input pixel of each output pixel is
+    axis = 1 if width >= height else 0
+    length, out_length = (width, out_width) if axis == 1 else \
+        (height, out_height)
+    positions = np.arange(length)
+    gray_codes = positions ^ (positions >> 1)
+    codes = np.zeros((out_length,), dtype=np.int64)
+    for bit_idx in range(int(np.ceil(np.log2(length)))):
+        bits = ((gray_codes >> bit_idx) & 1).astype(bool)
+        lines = []
+        for stripes in (np.where(bits, 192, 64), np.where(bits, 64, 192)):
+            stripes = stripes.astype(np.uint8)
+            if axis == 1:
+                frame = np.tile(stripes, (height, 1))
+            else:
+                frame = np.tile(stripes[:, None], (1, width))
+            eye.clearBuffers()
+            eye.run(frame)
+            out_frame = eye.getParvoRAW().reshape(out_height, out_width)
+            lines.append(out_frame[out_height//2-1] if axis == 1 else
+                         out_frame[:, out_width//2-1])
+        codes |= (lines[0] > lines[1]).astype(np.int64) << bit_idx
+
+    # Gray codes to input positions
+    shift = codes >> 1
+    while shift.any():
+        codes ^= shift
+        shift >>= 1
+
+    # walk out from the centre on both sides while the sampled distance
+    # grows, the border of the output samples the edge of the disc
+    out_centre = out_length/2.-1
+    centre = (length-1)/2.
+    radii = []
+    distances = []
+    for step in (1, -1):
+        samples = []
+        idx = int(out_centre)
+        while 0 <= idx < out_length and 0 <= codes[idx] < length:
+            distance = (codes[idx]-centre)*step
+            if len(samples) > 0 and distance < samples[-1][1]:
+                break
+            samples.append((abs(idx-out_centre), distance))
+            idx += step
+        while len(samples) > 1 and samples[-1][1] == samples[-2][1]:
+            samples.pop()
+        radii += [sample[0] for sample in samples]
+        distances += [sample[1] for sample in samples]
+
+    # an input pixel is sampled by several output pixels near the centre
+    distances, inverse = np.unique(distances, return_inverse=True)
+    radii = np.bincount(inverse, radii)/np.bincount(inverse)
+    radii = np.maximum.accumulate(radii)
+
+    rows, cols = np.mgrid[:height, :width].astype(np.float32)
+    rows -= (height-1)/2.
+    cols -= (width-1)/2.
+    in_radii = np.hypot(rows, cols)
+    ratios = np.interp(in_radii, distances, radii, right=np.nan) / \
+        np.maximum(in_radii, 1e-6)
+    outside = np.isnan(ratios)
+    ratios[outside] = 0
+
+    map_x = (out_width/2.-1+cols*ratios).astype(np.float32)
+    map_y = (out_height/2.-1+rows*ratios).astype(np.float32)
+    map_x[outside] = -1
+    map_y[outside] = -1
+
+    return map_x, map_y
+
+
+def get_scaled_size(size, scale):
+    """Get the size (height, width) of a retina scaled by a factor."""
+    return (max(1, int(round(size[0]*scale))),
+            max(1, int(round(size[1]*scale))))
+
+
+def init_batch_retina(size, num_streams):
+    """Initialize a retina that runs many streams in lockstep.
+
+    The batch retina is driven by the numpy backend.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the retina receptive field (height, width)
+    num_streams : int
+        number of streams processed per step
     """
     if len(size) != 2:
         raise ValueError("Invalid size setting.")
 
-    return bioinspired.createRetina((size[1], size[0]))
+    return BatchRetina(size, num_streams)
 
 
 def clear_buffers(retina):
@@ -27,8 +257,105 @@ def clear_buffers(retina):
     retina.clearBuffers()
 
 
+def save_state(retina, file_path, frames=None):
+    """Save the parameters and the temporal state of a retina.
+
+    The state is stored with numpy.savez_compressed. The numpy backend
+    stores its filter buffers, so it resumes exactly. The filter buffers
+    of an OpenCV retina are not accessible, its setup is stored and the
+    given recent frames are replayed by load_state to re-converge the
+    buffers instead. This resume is approximate when the retina has seen
+    more frames than the replayed ones, the outputs settle after a few
+    frames.
+
+    Parameters
+    ----------
+    retina : cv2.bioinspired_Retina
+        the retina model
+    file_path : string
+        the path of the state file (.npz)
+    frames : list
+        the most recent input frames, oldest first, only used for an
+        OpenCV retina
+    """
+    input_size = retina.getInputSize()
+    state = {"size": np.array([input_size[1], input_size[0]])}
+
+    if isinstance(retina, NumpyRetina):
+        state["backend"] = np.array("numpy")
+        state.update(retina.getState())
+    else:
+        state["backend"] = np.array("opencv")
+        temp_dir = tempfile.mkdtemp()
+        try:
+            setup_path = os.path.join(temp_dir, "retina.xml")
+            retina.write(setup_path)
+            with open(setup_path, "rb") as setup_file:
+                state["setup"] = np.frombuffer(setup_file.read(),
+                                               dtype=np.uint8)
+        finally:
+            shutil.rmtree(temp_dir)
+        if frames is not None and len(frames) > 0:
+            state["frames"] = np.stack(frames)
+
+    np.savez_compressed(file_path, **state)
+
+
+def load_state(file_path, retina=None):
+    """Load the state saved by save_state.
+
+    Parameters
+    ----------
+    file_path : string
+        the path of the state file (.npz)
+    retina : cv2.bioinspired_Retina
+        the retina to restore, a new retina of the saved size and backend
+        is initialized if None
+
+    Returns
+    -------
+    retina : cv2.bioinspired_Retina
+        the restored retina model
+    """
+    with np.load(file_path) as state_file:
+        state = dict((key, state_file[key]) for key in state_file.files)
+
+    size = tuple(state["size"].tolist())
+    backend = str(state["backend"])
+    if retina is None:
+        retina = init_retina(size, backend=backend)
+
+    input_size = retina.getInputSize()
+    if (input_size[1], input_size[0]) != size:
+        raise ValueError("The state does not fit the retina.")
+
+    if backend == "numpy":
+        if not isinstance(retina, NumpyRetina):
+            raise ValueError("The state was saved by the numpy backend.")
+        retina.setState(state)
+        return retina
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        setup_path = os.path.join(temp_dir, "retina.xml")
+        with open(setup_path, "wb") as setup_file:
+            setup_file.write(state["setup"].tobytes())
+        retina.setup(setup_path)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    clear_buffers(retina)
+    if "frames" in state:
+        for frame in state["frames"]:
+            retina.run(frame)
+
+    return retina
+
+
 def get_opl_frame(retina, frame, get_parvo=True, get_magno=True,
-                  color_mode="color"):
+                  color_mode="color", parvo_out=None, magno_out=None,
+                  expand_mode="copy", back_project=None, raw=False,
+                  scale=1., upsample=False):
     """Get Parvo frame by given retina model and original image.
 
     Parameters
@@ -43,6 +370,30 @@ def get_opl_frame(retina, frame, get_parvo=True, get_magno=True,
         return magno frames if True, otherwise False
     color_mode : string
         indicate color mode, the options are "color", "gray"
+    parvo_out : numpy.ndarray
+        if given, the parvo frame is written into this (H, W, 3) buffer
+        which is then returned instead of a new frame
+    magno_out : numpy.ndarray
+        if given, the magno frame is written into this (H, W, 3) buffer
+        which is then returned instead of a new frame
+    expand_mode : string
+        how single channel outputs (magno, gray parvo) are returned,
+        "copy" duplicates them into a BGR frame, "view" returns a read-only
+        BGR view of the single channel, "none" returns the (H, W) frame
+    back_project : tuple
+        the maps of init_back_projection, if given the outputs of a
+        foveated retina are projected back to the input size, otherwise
+        they are in the sampled space
+    raw : bool
+        if True, return the float32 outputs of the retina without the
+        normalisation and 8-bit conversion, see get_raw_frames.
+        expand_mode is ignored and the out buffers have to match the
+        raw frames
+    scale : float
+        the scale the retina was initialized with (see init_retina), the
+        frame is downsampled to the retina size if smaller than 1
+    upsample : bool
+        if True, the outputs are upsampled to the size of the frame
 
     Returns
     -------
@@ -51,15 +402,9 @@ def get_opl_frame(retina, frame, get_parvo=True, get_magno=True,
     magno_frame ; numpy.ndarray
         a BGR colored magno frame
     """
-    retina.run(frame)
-
-    parvo_frame = retina.getParvo()
-    magno_frame = retina.getMagno()
-
-    if color_mode == "gray":
-        parvo_frame = gray2color(parvo_frame)
-
-    magno_frame = gray2color(magno_frame)
+    parvo_frame, magno_frame = _run_opl_frame(
+        retina, frame, get_parvo, get_magno, color_mode, parvo_out,
+        magno_out, expand_mode, back_project, raw, scale, upsample)
 
     if get_parvo is False and get_magno is True:
         return magno_frame
@@ -69,13 +414,278 @@ def get_opl_frame(retina, frame, get_parvo=True, get_magno=True,
         return parvo_frame, magno_frame
 
 
-def gray2color(frame):
+def activate_channels(retina, get_parvo=True, get_magno=True):
+    """Only compute the channels of the retina that are requested.
+
+    The magno channel of the OpenCV retina is computed from the parvo
+    processing, so the parvo channel stays active for magno only outputs
+    unless the retina sets magno_needs_parvo to False.
+
+    Parameters
+    ----------
+    retina : cv2.bioinspired_Retina
+        the retina model
+    get_parvo : bool
+        compute the parvo channel if True
+    get_magno : bool
+        compute the magno channel if True
+    """
+    needs_parvo = getattr(retina, "magno_needs_parvo", True)
+    retina.activateContoursProcessing(
+        get_parvo is True or (get_magno is True and needs_parvo is True))
+    retina.activateMovingContoursProcessing(get_magno is True)
+
+
+def get_raw_frames(retina, get_parvo=True, get_magno=True):
+    """Get the float32 outputs of the last run of the retina.
+
+    The flat outputs of getParvoRAW and getMagnoRAW are reshaped as views,
+    so no copy, normalisation or 8-bit conversion is done. A colored parvo
+    frame is a (H, W, 3) BGR view over the planar output of the retina.
+
+    Parameters
+    ----------
+    retina : cv2.bioinspired_Retina
+        the retina model
+    get_parvo : bool
+        return the parvo frame if True, otherwise None
+    get_magno : bool
+        return the magno frame if True, otherwise None
+
+    Returns
+    -------
+    parvo_frame : numpy.ndarray
+        a (H, W) or (H, W, 3) float32 parvo frame, or None
+    magno_frame : numpy.ndarray
+        a (H, W) float32 magno frame, or None
+    """
+    width, height = retina.getOutputSize()
+
+    parvo_frame = None
+    magno_frame = None
+
+    if get_parvo is True:
+        parvo_frame = retina.getParvoRAW()
+        if parvo_frame.size == height*width:
+            parvo_frame = parvo_frame.reshape(height, width)
+        else:
+            # the planes of the retina are in RGB order
+            parvo_frame = parvo_frame.reshape(3, height, width)
+            parvo_frame = parvo_frame[::-1].transpose(1, 2, 0)
+
+    if get_magno is True:
+        magno_frame = retina.getMagnoRAW().reshape(height, width)
+
+    return parvo_frame, magno_frame
+
+
+def _run_opl_frame(retina, frame, get_parvo, get_magno, color_mode,
+                   parvo_out, magno_out, expand_mode, back_project,
+                   raw=False, scale=1., upsample=False):
+    """Run a frame and return (parvo, magno), None for unrequested."""
+    if back_project is True:
+        raise ValueError("Pass the maps of init_back_projection as "
+                         "back_project.")
+    elif back_project is False:
+        back_project = None
+
+    # size (width, height) the outputs are resized to
+    out_size = (frame.shape[1], frame.shape[0]) if upsample is True else \
+        None
+
+    if scale != 1:
+        frame = _resize_frame(frame, tuple(retina.getInputSize()),
+                              cv2.INTER_AREA)
+
+    activate_channels(retina, get_parvo, get_magno)
+    with profiling.stage("retina.run"):
+        retina.run(frame)
+
+    if raw is True:
+        return _finish_raw_frames(retina, get_parvo, get_magno, parvo_out,
+                                  magno_out, out_size, back_project)
+
+    parvo_frame = None
+    magno_frame = None
+
+    if get_parvo is True:
+        with profiling.stage("retina.getParvo"):
+            parvo_frame = retina.getParvo()
+        parvo_frame = _project_frame(parvo_frame, out_size, back_project)
+
+        if color_mode == "gray" or (parvo_out is not None and
+                                    parvo_frame.ndim == 2):
+            parvo_frame = _expand_gray(parvo_frame, expand_mode, parvo_out)
+        elif parvo_out is not None:
+            parvo_out[...] = parvo_frame
+            parvo_frame = parvo_out
+
+    if get_magno is True:
+        with profiling.stage("retina.getMagno"):
+            magno_frame = retina.getMagno()
+        magno_frame = _project_frame(magno_frame, out_size, back_project)
+        magno_frame = _expand_gray(magno_frame, expand_mode, magno_out)
+
+    return parvo_frame, magno_frame
+
+
+def _finish_raw_frames(retina, get_parvo, get_magno, parvo_out, magno_out,
+                       out_size, back_project=None):
+    """Resize raw frames and write them to the given buffers."""
+    out_frames = []
+    for raw_frame, out in zip(get_raw_frames(retina, get_parvo, get_magno),
+                              (parvo_out, magno_out)):
+        if raw_frame is not None:
+            if out_size is not None or back_project is not None:
+                raw_frame = _project_frame(np.ascontiguousarray(raw_frame),
+                                           out_size, back_project)
+            if out is not None:
+                np.copyto(out, raw_frame)
+                raw_frame = out
+        out_frames.append(raw_frame)
+
+    return tuple(out_frames)
+
+
+def back_project_frame(frame, maps):
+    """Project an output of a foveated retina back to the input size.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        an output frame in the sampled space
+    maps : tuple
+        the maps of the retina, see init_back_projection
+
+    Returns
+    -------
+    new_frame : numpy.ndarray
+        the frame at the input size of the retina, black outside of the
+        sampled disc
+    """
+    return cv2.remap(frame, maps[0], maps[1], cv2.INTER_LINEAR,
+                     borderMode=cv2.BORDER_CONSTANT)
+
+
+def _project_frame(frame, out_size, back_project):
+    """Back project a frame if maps are given, then resize it if needed."""
+    if back_project is not None:
+        frame = back_project_frame(frame, back_project)
+    if out_size is not None:
+        frame = _resize_frame(frame, out_size)
+
+    return frame
+
+
+def _resize_frame(frame, size, interpolation=cv2.INTER_LINEAR):
+    """Resize a frame to size (width, height) if needed."""
+    if (frame.shape[1], frame.shape[0]) == size:
+        return frame
+
+    return cv2.resize(frame, size, interpolation=interpolation)
+
+
+def get_tone_mapped_frame(retina, frame):
+    """Get a tone mapped frame of a still image in a single pass.
+
+    Unlike get_opl_frame, the fast tone mapping of the retina does not
+    need several runs to converge.
+
+    Parameters
+    ----------
+    retina : cv2.bioinspired_Retina
+        the retina model
+    frame : numpy.ndarray
+        a frame
+
+    Returns
+    -------
+    tone_mapped_frame : numpy.ndarray
+        a parvo like tone mapped frame
+    """
+    return retina.applyFastToneMapping(frame)
+
+
+def iter_tone_mapped_frames(frames, para_dict=None, pool=None):
+    """Iterate tone mapped frames of still images of any sizes.
+
+    Parameters
+    ----------
+    frames : iterable
+        an iterable of frames
+    para_dict : dictionary or RetinaParams
+        a given retina dictionary, or None for the default setup
+    pool : RetinaPool
+        the pool retinas are taken from, a new one if None
+
+    Yields
+    ------
+    tone_mapped_frame : numpy.ndarray
+        a parvo like tone mapped frame
+    """
+    if pool is None:
+        pool = RetinaPool()
+
+    eye_size = None
+    for frame in frames:
+        if frame.shape[:2] != eye_size:
+            eye_size = frame.shape[:2]
+            eye = pool.get(eye_size, para_dict)
+        yield get_tone_mapped_frame(eye, frame)
+
+
+def tone_map_images(image_dir, out_dir=None, para_dict=None, color=True):
+    """Tone map all images of a directory.
+
+    Parameters
+    ----------
+    image_dir : string
+        directory of the images
+    out_dir : string
+        if given, the tone mapped images are written in this directory
+        under the same file names
+    para_dict : dictionary or RetinaParams
+        a given retina dictionary, or None for the default setup
+    color : bool
+        process color images if True, gray images if False
+
+    Yields
+    ------
+    image_path : string
+        path of the source image
+    tone_mapped_frame : numpy.ndarray
+        the tone mapped image
+    """
+    if out_dir is not None and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    pool = RetinaPool()
+    eye_size = None
+    for image_path, frame in dataset.iter_images(image_dir, color=color):
+        if frame.shape[:2] != eye_size:
+            eye_size = frame.shape[:2]
+            eye = pool.get(eye_size, para_dict)
+        tone_mapped_frame = get_tone_mapped_frame(eye, frame)
+
+        if out_dir is not None:
+            cv2.imwrite(os.path.join(out_dir, os.path.basename(image_path)),
+                        tone_mapped_frame)
+        yield image_path, tone_mapped_frame
+
+
+def gray2color(frame, out=None, view=False):
     """Transform a gray frame to color frame by duplication.
 
     Parameters
     ----------
     frame : numpy.ndarray
         a gray frame
+    out : numpy.ndarray
+        if given, the color frame is written into this (H, W, 3) buffer
+        instead of allocating a new one
+    view : bool
+        if True, return a read-only (H, W, 3) view that shares the memory
+        of the gray frame instead of a copy
 
     Returns
     -------
@@ -85,19 +695,158 @@ def gray2color(frame):
     if frame.ndim != 2:
         raise ValueError("Input frame is not a gray frame.")
 
-    return np.transpose(np.tile(frame, (3, 1, 1)), (1, 2, 0))
+    with profiling.stage("retina.gray2color"):
+        if out is not None:
+            out[...] = frame[:, :, np.newaxis]
+            return out
+
+        if view is True:
+            return np.broadcast_to(frame[:, :, np.newaxis],
+                                   frame.shape+(3,))
+
+        return np.transpose(np.tile(frame, (3, 1, 1)), (1, 2, 0))
+
+
+def _expand_gray(frame, expand_mode, out=None):
+    """Expand a single channel output according to the expand mode."""
+    if expand_mode not in ["copy", "view", "none"]:
+        raise ValueError("Unsupported expand mode %s." % (expand_mode))
+
+    if out is not None:
+        if out.ndim == 2:
+            out[...] = frame
+            return out
+        return gray2color(frame, out=out)
+
+    if expand_mode == "none":
+        return frame
+
+    return gray2color(frame, view=(expand_mode == "view"))
+
+
+def get_opl_batch(retina, frames, get_parvo=True, get_magno=True,
+                  color_mode="color", expand_mode="copy"):
+    """Get Parvo and Magno frames of a batch of streams for one step.
+
+    Parameters
+    ----------
+    retina : simretina.numpy_retina.BatchRetina
+        the batch retina model
+    frames : numpy.ndarray
+        a (B, H, W) or (B, H, W, 3) batch of frames, one per stream
+    get_parvo : bool
+        return parvo frames if True, otherwise False
+    get_magno : bool
+        return magno frames if True, otherwise False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+    expand_mode : string
+        how single channel outputs are returned, the options are
+        "copy", "view", "none", see get_opl_frame
+
+    Returns
+    -------
+    parvo_frames : numpy.ndarray
+        (B, H, W, 3) BGR colored parvo frames
+    magno_frames ; numpy.ndarray
+        (B, H, W, 3) BGR colored magno frames
+    """
+    if expand_mode not in ["copy", "view", "none"]:
+        raise ValueError("Unsupported expand mode %s." % (expand_mode))
+
+    activate_channels(retina, get_parvo, get_magno)
+    with profiling.stage("retina.run_batch"):
+        retina.run(frames)
+
+    parvo_frames = retina.getParvo() if get_parvo is True else None
+    magno_frames = retina.getMagno() if get_magno is True else None
+
+    if expand_mode != "none":
+        if color_mode == "gray" and parvo_frames is not None:
+            parvo_frames = np.broadcast_to(parvo_frames[..., np.newaxis],
+                                           parvo_frames.shape+(3,))
+        if magno_frames is not None:
+            magno_frames = np.broadcast_to(magno_frames[..., np.newaxis],
+                                           magno_frames.shape+(3,))
+        if expand_mode == "copy" and parvo_frames is not None:
+            parvo_frames = np.array(parvo_frames)
+        if expand_mode == "copy" and magno_frames is not None:
+            magno_frames = np.array(magno_frames)
+
+    if get_parvo is False and get_magno is True:
+        return magno_frames
+    elif get_parvo is True and get_magno is False:
+        return parvo_frames
+    elif get_parvo is True and get_magno is True:
+        return parvo_frames, magno_frames
+
+
+def iter_opl_frames(retina, frames, get_parvo=True, get_magno=True,
+                    reopen_eye=True, color_mode="color", expand_mode="copy",
+                    back_project=None, raw=False, scale=1.,
+                    upsample=False):
+    """Iterate provo and magno frames from an iterable of frames.
+
+    Unlike get_opl_frames, the frames are consumed and processed one at
+    a time, so the memory footprint does not grow with the clip length.
+
+    Parameters
+    ----------
+    retina : cv2.bioinspired_Retina
+        the retina model
+    frames : iterable
+        any iterable of given frames (list, generator, video reader, etc.)
+    get_parvo : bool
+        return parvo frames if True, otherwise False
+    get_magno : bool
+        return magno frames if True, otherwise False
+    reopen_eye : bool
+        clear buffers if True, else False
+    color_mode : string
+        indicate color mode, the options are "color", "gray"
+    expand_mode : string
+        how single channel outputs are returned, the options are
+        "copy", "view", "none", see get_opl_frame
+    back_project : tuple
+        the maps that project the outputs of a foveated retina back to
+        the input size, see get_opl_frame
+    raw : bool
+        yield the float32 outputs of the retina, see get_opl_frame
+    scale : float
+        the scale the retina was initialized with, see get_opl_frame
+    upsample : bool
+        upsample the outputs to the size of the frames
+
+    Yields
+    ------
+    out_frames : tuple or numpy.ndarray
+        (parvo_frame, magno_frame) if both channels are requested,
+        otherwise the single requested frame, see get_opl_frame
+    """
+    if reopen_eye is True:
+        clear_buffers(retina)
+
+    for frame in frames:
+        yield get_opl_frame(retina, frame, get_parvo=get_parvo,
+                            get_magno=get_magno, color_mode=color_mode,
+                            expand_mode=expand_mode,
+                            back_project=back_project, raw=raw,
+                            scale=scale, upsample=upsample)
 
 
 def get_opl_frames(retina, frames, get_parvo=True, get_magno=True,
-                   reopen_eye=True, color_mode="color"):
+                   reopen_eye=True, color_mode="color", stack=False,
+                   out=None, expand_mode="copy", back_project=None,
+                   raw=False, scale=1., upsample=False):
     """Get provo and magno frames from a sequence of frames.
 
     Parameters
     ----------
     retina : cv2.bioinspired_Retina
         the retina model
-    frame : list
-        a list of given frames
+    frame : list, numpy.ndarray or dataset.Video
+        a list of given frames, stacked frames (e.g. a cached video) or a
+        video decoded on demand
     get_parvo : bool
         return parvo frames if True, otherwise False
     get_magno : bool
@@ -106,22 +855,55 @@ def get_opl_frames(retina, frames, get_parvo=True, get_magno=True,
         clear buffers if True, else False
     color_mode : string
         indicate color mode, the options are "color", "grey"
+    stack : bool
+        if True, return a single contiguous (N, H, W, C) array per channel
+        instead of a list of frames
+    out : numpy.ndarray or tuple
+        preallocated (N, H, W, C) or (N, H, W) buffer the frames are
+        written into, a tuple (parvo_out, magno_out) if both channels are
+        requested. The buffers are uint8, float32 if raw is True, and are
+        checked before any frame is run. Implies stack=True.
+    expand_mode : string
+        how single channel outputs are returned, the options are
+        "copy", "view", "none", see get_opl_frame
+    back_project : tuple
+        the maps that project the outputs of a foveated retina back to
+        the input size, see get_opl_frame
+    raw : bool
+        return the float32 outputs of the retina, see get_opl_frame
+    scale : float
+        the scale the retina was initialized with, see get_opl_frame
+    upsample : bool
+        upsample the outputs to the size of the frames
+
+    Returns
+    -------
+    parvo_frames : list or numpy.ndarray
+        parvo frames (optional)
+    magno_frames : list or numpy.ndarray
+        magno frames (optional)
     """
-    if len(frames) == 0 or not isinstance(frames, list):
+    if not isinstance(frames, (list, np.ndarray, dataset.Video)) or \
+            len(frames) == 0:
         raise ValueError("No video frame is entered")
 
-    if reopen_eye is True:
-        clear_buffers(retina)
+    if stack is True or out is not None:
+        return _stack_opl_frames(retina, frames, get_parvo, get_magno,
+                                 reopen_eye, color_mode, out, expand_mode,
+                                 back_project, raw, scale, upsample)
 
     if get_parvo is True:
         parvo_frames = []
     if get_magno is True:
         magno_frames = []
 
-    for frame in frames:
-        out_frames = get_opl_frame(retina, frame, get_parvo=get_parvo,
-                                   get_magno=get_magno, color_mode=color_mode)
-
+    for out_frames in iter_opl_frames(retina, frames, get_parvo=get_parvo,
+                                      get_magno=get_magno,
+                                      reopen_eye=reopen_eye,
+                                      color_mode=color_mode,
+                                      expand_mode=expand_mode,
+                                      back_project=back_project, raw=raw,
+                                      scale=scale, upsample=upsample):
         if get_parvo is True and get_magno is True:
             parvo_frames.append(out_frames[0])
             magno_frames.append(out_frames[1])
@@ -138,6 +920,100 @@ def get_opl_frames(retina, frames, get_parvo=True, get_magno=True,
         return magno_frames
 
 
+def _stack_opl_frames(retina, frames, get_parvo, get_magno, reopen_eye,
+                      color_mode, out, expand_mode, back_project,
+                      raw=False, scale=1., upsample=False):
+    """Write the outputs of get_opl_frames into stacked arrays."""
+    parvo_out, magno_out = _check_out_buffers(
+        retina, frames, get_parvo, get_magno, out, back_project, raw,
+        upsample)
+
+    if reopen_eye is True:
+        clear_buffers(retina)
+
+    for idx, frame in enumerate(frames):
+        parvo_frame, magno_frame = _run_opl_frame(
+            retina, frame, get_parvo, get_magno, color_mode,
+            None if parvo_out is None else parvo_out[idx],
+            None if magno_out is None else magno_out[idx],
+            expand_mode, back_project, raw, scale, upsample)
+
+        # allocate missing buffers once the output shape is known
+        if get_parvo is True and parvo_out is None:
+            parvo_out = np.empty((len(frames),)+parvo_frame.shape,
+                                 dtype=parvo_frame.dtype)
+            parvo_out[idx] = parvo_frame
+        if get_magno is True and magno_out is None:
+            magno_out = np.empty((len(frames),)+magno_frame.shape,
+                                 dtype=magno_frame.dtype)
+            magno_out[idx] = magno_frame
+
+    if get_parvo is True and get_magno is True:
+        return parvo_out, magno_out
+    elif get_parvo is True and get_magno is False:
+        return parvo_out
+    elif get_parvo is False and get_magno is True:
+        return magno_out
+
+
+def _check_out_buffers(retina, frames, get_parvo, get_magno, out,
+                       back_project, raw, upsample):
+    """Split the out argument of get_opl_frames into checked buffers.
+
+    The buffers are checked before any frame is run, so that a wrong
+    buffer does not leave the retina half way through the frames.
+
+    Returns
+    -------
+    parvo_out : numpy.ndarray
+        the parvo buffer or None
+    magno_out : numpy.ndarray
+        the magno buffer or None
+    """
+    if get_parvo is True and get_magno is True:
+        if out is None:
+            return None, None
+        if not isinstance(out, tuple) or len(out) != 2:
+            raise ValueError("The output buffers have to be a tuple "
+                             "(parvo_out, magno_out).")
+        parvo_out, magno_out = out
+    elif get_parvo is True:
+        parvo_out, magno_out = out, None
+    else:
+        parvo_out, magno_out = None, out
+
+    # size (height, width) of the output frames
+    if upsample is True:
+        size = frames[0].shape[:2]
+    elif isinstance(back_project, tuple):
+        size = back_project[0].shape
+    else:
+        size = tuple(retina.getOutputSize())[::-1]
+    dtype = np.float32 if raw is True else np.uint8
+
+    for name, buf in (("parvo", parvo_out), ("magno", magno_out)):
+        if buf is None:
+            continue
+        if not isinstance(buf, np.ndarray):
+            raise ValueError("The %s output buffer is not an array."
+                             % (name))
+        if buf.shape[0] < len(frames):
+            raise ValueError("The %s output buffer is too small for %d "
+                             "frames." % (name, len(frames)))
+        # the raw magno frames are single channel
+        frame_shapes = [size] if raw is True and name == "magno" else \
+            [size, size+(3,)]
+        if buf.shape[1:] not in frame_shapes:
+            raise ValueError("The %s output buffer has frames of shape %s, "
+                             "expected one of %s."
+                             % (name, buf.shape[1:], frame_shapes))
+        if buf.dtype != dtype:
+            raise ValueError("The %s output buffer is %s, expected %s."
+                             % (name, buf.dtype, np.dtype(dtype)))
+
+    return parvo_out, magno_out
+
+
 def create_para_dict(color_mode,
                      normalise_output_parvo,
                      photoreceptors_local_adaptation_sensitivity,
@@ -268,9 +1144,9 @@ def compare_para_dict(para_dict_old, para_dict_new):
 
     Parameters
     ----------
-    para_dict_old : dictionary
+    para_dict_old : dictionary or RetinaParams
         old parameter dictionary
-    para_dict_new : dictionary
+    para_dict_new : dictionary or RetinaParams
         new parameter dictionary
 
     Returns
@@ -278,12 +1154,7 @@ def compare_para_dict(para_dict_old, para_dict_new):
     status : bool
         True if same, False if different
     """
-    shared_item = set(para_dict_old.items()) & set(para_dict_new.items())
-
-    if len(shared_item) == len(para_dict_old):
-        return True
-    else:
-        return False
+    return para_dict_old == para_dict_new
 
 
 def apply_para_dict(retina, para_dict):
@@ -293,7 +1164,7 @@ def apply_para_dict(retina, para_dict):
     ----------
     retina : cv2.bioinspired_Retina
         the retina model
-    para_dict : dictionary
+    para_dict : dictionary or RetinaParams
         a given retina dicionary
 
     Returns
@@ -301,6 +1172,47 @@ def apply_para_dict(retina, para_dict):
     retina : cv2.bioinspired_Retina
         An updated retina model
     """
+    _setup_magno(retina, para_dict)
+    _setup_parvo(retina, para_dict)
+
+
+def apply_para_changes(retina, para_dict_old, para_dict_new):
+    """Apply only the channels whose parameters changed.
+
+    Unlike apply_para_dict followed by clear_buffers, the parvo or magno
+    channel is only reconfigured if one of its parameters changed, and
+    the temporal state of the retina is kept.
+
+    Parameters
+    ----------
+    retina : cv2.bioinspired_Retina
+        the retina model, set up with para_dict_old
+    para_dict_old : dictionary or RetinaParams
+        the current parameters of the retina
+    para_dict_new : dictionary or RetinaParams
+        the new parameters
+
+    Returns
+    -------
+    reset_required : bool
+        True if the color mode changed, in which case the buffers are
+        not valid anymore and should be cleared
+    """
+    parvo_changed = any(para_dict_old[key] != para_dict_new[key]
+                        for key in PARVO_KEYS)
+    magno_changed = any(para_dict_old[key] != para_dict_new[key]
+                        for key in MAGNO_KEYS)
+
+    if magno_changed is True:
+        _setup_magno(retina, para_dict_new)
+    if parvo_changed is True:
+        _setup_parvo(retina, para_dict_new)
+
+    return para_dict_old["color_mode"] != para_dict_new["color_mode"]
+
+
+def _setup_magno(retina, para_dict):
+    """Set up the IPL magno channel of a retina."""
     retina.setupIPLMagnoChannel(
         para_dict["normalise_output_magno"],
         para_dict["parasol_cells_beta"],
@@ -311,6 +1223,9 @@ def apply_para_dict(retina, para_dict):
         para_dict["local_adapt_integration_tau"],
         para_dict["local_adapt_integration_k"])
 
+
+def _setup_parvo(retina, para_dict):
+    """Set up the OPL and IPL parvo channel of a retina."""
     retina.setupOPLandIPLParvoChannel(
         para_dict["color_mode"],
         para_dict["normalise_output_parvo"],
@@ -321,3 +1236,367 @@ def apply_para_dict(retina, para_dict):
         para_dict["hcells_temporal_constant"],
         para_dict["hcells_spatial_constant"],
         para_dict["ganglion_cells_sensitivity"])
+
+
+class RetinaParams(object):
+    """An immutable and hashable set of retina parameters.
+
+    The parameters are the ones of create_para_dict, given by position in
+    the same order or by name. The object can be used wherever a
+    parameter dictionary is read (apply_para_dict, RetinaPool...), its
+    hash is computed once so that comparisons are cheap.
+    """
+
+    __slots__ = PARA_KEYS+("_hash",)
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(PARA_KEYS):
+            raise TypeError("Too many retina parameters.")
+
+        values = dict(zip(PARA_KEYS, args))
+        for key, value in kwargs.items():
+            if key not in PARA_KEYS:
+                raise TypeError("Unknown retina parameter %s." % (key))
+            if key in values:
+                raise TypeError("Retina parameter %s given twice." % (key))
+            values[key] = value
+
+        for key in PARA_KEYS:
+            if key not in values:
+                raise TypeError("Missing retina parameter %s." % (key))
+            object.__setattr__(self, key, values[key])
+
+        object.__setattr__(self, "_hash",
+                           hash(tuple(values[key] for key in PARA_KEYS)))
+
+    @classmethod
+    def from_dict(cls, para_dict):
+        """Create parameters from a parameter dictionary."""
+        return cls(**dict((key, para_dict[key]) for key in PARA_KEYS))
+
+    def to_dict(self):
+        """Get the parameters as a parameter dictionary."""
+        return dict(self.items())
+
+    def replace(self, **kwargs):
+        """Get a copy of the parameters with some values replaced."""
+        para_dict = self.to_dict()
+        para_dict.update(kwargs)
+        return self.__class__(**para_dict)
+
+    def keys(self):
+        return PARA_KEYS
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in PARA_KEYS]
+
+    def __getitem__(self, key):
+        if key not in PARA_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Retina parameters are immutable.")
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, RetinaParams):
+            if self._hash != other._hash:
+                return False
+            return self.items() == other.items()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, key)
+                                      for key in PARA_KEYS))
+
+    def __repr__(self):
+        return "RetinaParams(%s)" % (", ".join(
+            "%s=%r" % (key, value) for key, value in self.items()))
+
+
+def freeze_para_dict(para_dict):
+    """Freeze a parameter dictionary into a hashable key.
+
+    Parameters
+    ----------
+    para_dict : dictionary or RetinaParams
+        a given retina dictionary, or None for the default setup
+
+    Returns
+    -------
+    para_key : RetinaParams
+        the frozen parameters, None for the default setup
+    """
+    if para_dict is None or isinstance(para_dict, RetinaParams):
+        return para_dict
+
+    return RetinaParams.from_dict(para_dict)
+
+
+def get_default_para_dict():
+    """Get the default parameter dictionary of cv2.bioinspired.
+
+    Returns
+    -------
+    para_dict : dictionary
+        A paramter dictionary
+    """
+    return create_para_dict(
+        color_mode=True, normalise_output_parvo=True,
+        photoreceptors_local_adaptation_sensitivity=0.75,
+        photoreceptors_temporal_constant=0.9,
+        photoreceptors_spatial_constant=0.53,
+        horizontal_cells_gain=0.01,
+        hcells_temporal_constant=0.5,
+        hcells_spatial_constant=7.,
+        ganglion_cells_sensitivity=0.75,
+        normalise_output_magno=True,
+        parasol_cells_beta=0.,
+        parasol_cells_tau=0.,
+        parasol_cells_k=7.,
+        amacrin_cells_temporal_cut_frequency=2.,
+        v0_compression_parameter=0.95,
+        local_adapt_integration_tau=0.,
+        local_adapt_integration_k=7.)
+
+
+def scale_para_dict(para_dict, scale):
+    """Scale the spatial constants (in pixels) of a parameter set.
+
+    Parameters
+    ----------
+    para_dict : dictionary or RetinaParams
+        a given retina dictionary, or None for the default setup
+    scale : float
+        the scale of the retina, see init_retina
+
+    Returns
+    -------
+    para_dict : dictionary or RetinaParams
+        the scaled parameters, of the same type as the given ones
+    """
+    if para_dict is None:
+        para_dict = get_default_para_dict()
+
+    scaled = dict((key, para_dict[key]*scale) for key in SPATIAL_KEYS)
+
+    if isinstance(para_dict, RetinaParams):
+        return para_dict.replace(**scaled)
+
+    new_para_dict = dict(para_dict)
+    new_para_dict.update(scaled)
+    return new_para_dict
+
+
+def get_scale_fidelity(frames, scale, para_dict=None, backend="opencv"):
+    """Measure the fidelity loss and speedup of a reduced resolution retina.
+
+    The frames are processed by a full size retina and by a retina at the
+    given scale whose outputs are upsampled, the outputs are then
+    compared frame by frame.
+
+    Parameters
+    ----------
+    frames : list
+        a list of given frames
+    scale : float
+        the scale of the reduced retina, see init_retina
+    para_dict : dictionary or RetinaParams
+        a given retina dictionary, or None for the default setup
+    backend : string
+        the retina implementation, see init_retina
+
+    Returns
+    -------
+    fidelity : dictionary
+        "parvo_error" and "magno_error" are the mean absolute differences
+        (8-bit), "parvo_correlation" and "magno_correlation" the
+        correlations of the outputs and "speedup" the ratio of the
+        processing times of the full and the reduced retina
+    """
+    size = frames[0].shape[:2]
+
+    outputs = []
+    durations = []
+    for eye_scale in (1., scale):
+        eye = init_retina(size, backend=backend, scale=eye_scale)
+        if para_dict is not None:
+            apply_para_dict(eye, scale_para_dict(para_dict, eye_scale))
+
+        start_time = time.time()
+        outputs.append(get_opl_frames(
+            eye, frames, scale=eye_scale, upsample=True, stack=True,
+            expand_mode="none"))
+        durations.append(time.time()-start_time)
+
+    fidelity = {}
+    for idx, channel in enumerate(("parvo", "magno")):
+        full = outputs[0][idx].astype(np.float64)
+        reduced = outputs[1][idx].astype(np.float64)
+        fidelity[channel+"_error"] = float(np.abs(full-reduced).mean())
+        fidelity[channel+"_correlation"] = float(
+            np.corrcoef(full.ravel(), reduced.ravel())[0, 1])
+    fidelity["speedup"] = durations[0]/max(durations[1], 1e-12)
+
+    return fidelity
+
+
+def estimate_retina_memory(size):
+    """Estimate the memory held by a retina of given size.
+
+    Parameters
+    ----------
+    size : tuple
+        The size of the retina receptive field (height, width)
+
+    Returns
+    -------
+    num_bytes : int
+        estimated size of the internal filter buffers in bytes
+    """
+    return int(size[0]*size[1]*RETINA_BUFFERS_PER_PIXEL*4)
+
+
+class RetinaPool(object):
+    """A LRU pool of configured retina models.
+
+    Retinas are keyed by (height, width, frozen parameters) so that
+    switching back to a known input size and setup does not rebuild the
+    internal filter buffers. Retinas handed out by the pool are shared,
+    change their setup with RetinaPool.reconfigure instead of calling
+    apply_para_dict on them.
+
+    Parameters
+    ----------
+    max_size : int
+        maximum number of retinas kept in the pool
+    max_memory : int
+        maximum estimated memory in bytes held by the pool,
+        no limit if None
+    """
+
+    def __init__(self, max_size=8, max_memory=None):
+        if max_size < 1:
+            raise ValueError("The pool should hold at least one retina.")
+
+        self.max_size = max_size
+        self.max_memory = max_memory
+        self.memory_usage = 0
+        self._retinas = OrderedDict()
+
+    def __len__(self):
+        return len(self._retinas)
+
+    def __contains__(self, key):
+        return key in self._retinas
+
+    def get(self, size, para_dict=None):
+        """Get a cleared retina for the given size and parameters.
+
+        Parameters
+        ----------
+        size : tuple
+            The size of the retina receptive field (height, width)
+        para_dict : dictionary
+            a given retina dictionary, or None for the default setup
+
+        Returns
+        -------
+        retina : cv2.bioinspired_Retina
+            the retina model with cleared buffers
+        """
+        if len(size) != 2:
+            raise ValueError("Invalid size setting.")
+
+        key = (int(size[0]), int(size[1]), freeze_para_dict(para_dict))
+
+        if key in self._retinas:
+            # mark as most recently used
+            retina = self._retinas.pop(key)
+        else:
+            retina = init_retina(size)
+            if para_dict is not None:
+                apply_para_dict(retina, para_dict)
+            self.memory_usage += estimate_retina_memory(size)
+
+        self._retinas[key] = retina
+        self._evict(keep=key)
+
+        clear_buffers(retina)
+        return retina
+
+    def reconfigure(self, retina, para_dict):
+        """Change the parameters of a retina handed out by the pool.
+
+        Only the channels whose parameters changed are set up again and
+        the buffers are kept unless the color mode changed, see
+        apply_para_changes.
+
+        Parameters
+        ----------
+        retina : cv2.bioinspired_Retina
+            a retina handed out by the pool
+        para_dict : dictionary or RetinaParams
+            the new parameters
+
+        Returns
+        -------
+        retina : cv2.bioinspired_Retina
+            the reconfigured retina
+        """
+        for key, pool_retina in self._retinas.items():
+            if pool_retina is retina:
+                break
+        else:
+            raise ValueError("The retina is not in the pool.")
+
+        para_old = key[2]
+        para_new = freeze_para_dict(para_dict)
+        if para_new is None:
+            raise ValueError("No retina parameters are given.")
+        if para_old == para_new:
+            return retina
+
+        del self._retinas[key]
+        if para_old is None:
+            apply_para_dict(retina, para_new)
+            clear_buffers(retina)
+        elif apply_para_changes(retina, para_old, para_new) is True:
+            clear_buffers(retina)
+
+        new_key = key[:2]+(para_new,)
+        if new_key in self._retinas:
+            # drop the retina that held the new setup before
+            del self._retinas[new_key]
+            self.memory_usage -= estimate_retina_memory(key[:2])
+        self._retinas[new_key] = retina
+
+        return retina
+
+    def clear(self):
+        """Drop all retinas in the pool."""
+        self._retinas.clear()
+        self.memory_usage = 0
+
+    def _evict(self, keep):
+        """Evict least recently used retinas until limits are met."""
+        while len(self._retinas) > 1 and \
+                (len(self._retinas) > self.max_size or
+                 (self.max_memory is not None and
+                  self.memory_usage > self.max_memory)):
+            key = next(iter(self._retinas))
+            if key == keep:
+                break
+            del self._retinas[key]
+            self.memory_usage -= estimate_retina_memory(key[:2])
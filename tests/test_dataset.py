@@ -4,10 +4,17 @@ Author: Yuhuang Hu
 Email : yuhuang.hu@uzh.ch
 """
 
+import os
+import shutil
+import tempfile
+import threading
+from os.path import join
+
 import numpy as np
-from simretina import dataset
+from simretina import dataset, package_data_path
 
-from nose.tools import assert_equal, assert_not_equal
+from nose.tools import assert_equal, assert_not_equal, assert_true
+from nose.tools import assert_raises
 
 
 def test_get_lenna():
@@ -48,3 +55,94 @@ def test_get_taichi():
 
     assert_equal(taichi[0].shape, size)
     assert_not_equal(len(taichi), 0)
+
+
+def test_lazy_video():
+    """Test dataset.Video class."""
+    frames = dataset.get_horse_riding(size=False)
+
+    with dataset.get_horse_riding(size=False, lazy=True) as video:
+        assert_equal(len(video), len(frames))
+        assert_equal(video.shape, frames[0].shape)
+
+        for frame, ref_frame in zip(video, frames):
+            assert_true(np.array_equal(frame, ref_frame))
+        # random access and slicing
+        assert_true(np.array_equal(video[-1], frames[-1]))
+        assert_true(np.array_equal(video[20], frames[20]))
+
+        video_slice = video[10:40:10]
+        assert_equal(len(video_slice), 3)
+        assert_true(np.array_equal(video_slice[1], frames[20]))
+        video_slice.close()
+
+    assert_equal(video._reader, None)
+
+
+def test_get_frames():
+    """Test dataset.get_frames function."""
+    vid_path = join(package_data_path, "HorseRiding.avi")
+    frames = dataset.get_video(vid_path, size=False)
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        index = dataset.get_keyframe_index(vid_path, cache_dir=cache_dir)
+        assert_equal(index["keyframes"][0], 0)
+        assert_equal(len(os.listdir(cache_dir)), 1)
+
+        indices = [100, 3, 3, 50, len(frames)-1]
+        for frame, idx in zip(dataset.get_frames(vid_path, indices,
+                                                 cache_dir=cache_dir),
+                              indices):
+            assert_true(np.array_equal(frame, frames[idx]))
+
+        # negative indices count from the end like list indices
+        indices = [-1, -2, -len(frames)]
+        for frame, idx in zip(dataset.get_frames(vid_path, indices,
+                                                 cache_dir=cache_dir),
+                              indices):
+            assert_true(np.array_equal(frame, frames[idx]))
+
+        assert_raises(IndexError, dataset.get_frames, vid_path,
+                      [len(frames)], cache_dir=cache_dir)
+        assert_raises(IndexError, dataset.get_frames, vid_path,
+                      [-len(frames)-1], cache_dir=cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_get_cached_video():
+    """Test dataset.get_cached_video function."""
+    vid_path = join(package_data_path, "TaiChi.avi")
+    frames = dataset.get_video(vid_path, size=False)
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        cached_frames = dataset.get_cached_video(vid_path,
+                                                 cache_dir=cache_dir)
+        assert_equal(cached_frames.shape, (len(frames),)+frames[0].shape)
+        assert_true(np.array_equal(cached_frames[10], frames[10]))
+
+        # the least recently used video is evicted
+        gray_frames = dataset.get_cached_video(
+            vid_path, color=False, cache_dir=cache_dir, max_cache_size=1)
+        assert_equal(gray_frames.shape, cached_frames.shape[:3])
+        assert_equal(len(os.listdir(cache_dir)), 1)
+
+        # concurrent writers of the same video do not clash
+        shutil.rmtree(cache_dir)
+        os.makedirs(cache_dir)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            dataset.get_cached_video(vid_path, cache_dir=cache_dir)))
+            for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal(len(results), 2)
+        for frames in results:
+            assert_true(np.array_equal(frames, cached_frames))
+        assert_equal(len(os.listdir(cache_dir)), 1)
+    finally:
+        shutil.rmtree(cache_dir)
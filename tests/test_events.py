@@ -0,0 +1,47 @@
+"""Test events module.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import numpy as np
+from simretina import dataset, retina, events
+
+from nose.tools import assert_equal, assert_true, assert_raises
+
+
+def test_event_generator():
+    """Test events.EventGenerator class."""
+    generator = events.EventGenerator((2, 3), threshold=10., refractory=2.)
+    frame = np.zeros((2, 3), dtype=np.float32)
+
+    assert_equal(generator.update(frame, 0.).size, 0)
+
+    frame[0, 1] = 15.
+    frame[1, 2] = -12.
+    new_events = generator.update(frame, 1.)
+    assert_equal(new_events.dtype, events.EVENT_DTYPE)
+    assert_equal(new_events["x"].tolist(), [1, 2])
+    assert_equal(new_events["polarity"].tolist(), [1, -1])
+
+    # within the refractory period
+    frame[0, 1] = 0.
+    assert_equal(generator.update(frame, 2.).size, 0)
+    assert_equal(generator.update(frame, 3.)["polarity"].tolist(), [-1])
+
+    assert_raises(ValueError, events.EventGenerator, (2, 3), threshold=0.)
+
+
+def test_get_events():
+    """Test events.get_events function."""
+    frames = dataset.get_horse_riding(size=False)[:10]
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    all_events = events.get_events(eye, frames, frame_rate=10.)
+
+    assert_true(all_events.size > 0)
+    assert_true(np.all(np.diff(all_events["t"]) >= 0))
+    assert_true(all_events["t"].max() <= 0.9)
+
+    frame = events.events_to_frame(all_events, frames[0].shape[:2])
+    assert_true(np.abs(frame).sum() <= all_events.size)
@@ -0,0 +1,121 @@
+"""Test numpy_retina module.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import cv2
+import numpy as np
+from simretina import dataset, numpy_retina, retina
+from simretina.numpy_retina import NumpyRetina
+
+from nose.tools import assert_equal, assert_true
+
+
+def test_init_retina_numpy():
+    """Test retina.init_retina function with numpy backend."""
+    eye = retina.init_retina((48, 64), backend="numpy")
+
+    assert_true(isinstance(eye, NumpyRetina))
+    assert_equal(eye.getInputSize(), (64, 48))
+
+
+def test_lp_filter():
+    """Test numpy_retina.lp_filter against the recursion it computes."""
+    rng = np.random.RandomState(42)
+    frame = rng.rand(2, 40, 150).astype(np.float32)*255.
+
+    for coefficients in (numpy_retina.lp_coefficients(0., 0.9, 0.53),
+                         numpy_retina.lp_coefficients(0.01, 0.5, 7.)):
+        a, gain, tau = coefficients
+        state = rng.rand(*frame.shape).astype(np.float32)
+
+        # causal and anticausal passes on rows then columns
+        expected = frame.astype(np.float64)+tau*state
+        for axis in (2, 1):
+            expected = np.moveaxis(expected, axis, 0)
+            for idx in range(1, expected.shape[0]):
+                expected[idx] += a*expected[idx-1]
+            for idx in range(expected.shape[0]-2, -1, -1):
+                expected[idx] += a*expected[idx+1]
+            expected = np.moveaxis(expected, 0, axis)
+        expected *= gain
+
+        result = numpy_retina.lp_filter(frame, state, coefficients)
+        assert_true(np.abs(result-expected).max() <=
+                    1e-4*np.abs(expected).max())
+
+
+def test_numpy_retina_agreement():
+    """Test agreement of NumpyRetina with the OpenCV backend."""
+    frames = [cv2.resize(frame, (160, 120))
+              for frame in dataset.get_horse_riding(size=False)[:15]]
+
+    eye_cv = retina.init_retina(frames[0].shape[:2])
+    eye_np = retina.init_retina(frames[0].shape[:2], backend="numpy")
+
+    parvo_cv, magno_cv = retina.get_opl_frames(eye_cv, frames, stack=True)
+    parvo_np, magno_np = retina.get_opl_frames(eye_np, frames, stack=True)
+
+    assert_equal(parvo_np.shape, parvo_cv.shape)
+    assert_equal(magno_np.shape, magno_cv.shape)
+
+    # skip the convergence period
+    parvo_corr = np.corrcoef(parvo_cv[5:].ravel(), parvo_np[5:].ravel())
+    magno_corr = np.corrcoef(magno_cv[5:].ravel(), magno_np[5:].ravel())
+
+    assert_true(parvo_corr[0, 1] > 0.85)
+    assert_true(magno_corr[0, 1] > 0.85)
+
+
+def test_batch_retina():
+    """Test retina.get_opl_batch function with a batch retina."""
+    rng = np.random.RandomState(42)
+    frames = rng.randint(0, 256, size=(4, 2, 24, 32, 3)).astype(np.uint8)
+
+    batch_eye = retina.init_batch_retina((24, 32), num_streams=2)
+    eyes = [retina.init_retina((24, 32), backend="numpy") for i in range(2)]
+
+    for step in range(frames.shape[0]):
+        parvo, magno = retina.get_opl_batch(batch_eye, frames[step])
+        for stream, eye in enumerate(eyes):
+            parvo_ref, magno_ref = retina.get_opl_frame(
+                eye, frames[step, stream])
+
+            assert_true(np.abs(parvo[stream].astype(int) -
+                               parvo_ref).max() <= 1)
+            assert_true(np.abs(magno[stream].astype(int) -
+                               magno_ref).max() <= 1)
+
+    # a cleared stream restarts like a new retina
+    batch_eye.clearBuffers(stream=0)
+    eye = retina.init_retina((24, 32), backend="numpy")
+    _, magno = retina.get_opl_batch(batch_eye, frames[0])
+    _, magno_ref = retina.get_opl_frame(eye, frames[0, 0])
+
+    assert_equal(magno.shape, (2, 24, 32, 3))
+    assert_true(np.abs(magno[0].astype(int)-magno_ref).max() <= 1)
+
+
+def test_batch_retina_groups():
+    """Test a batch retina that runs its streams in groups."""
+    rng = np.random.RandomState(42)
+    frames = rng.randint(0, 256, size=(3, 3, 24, 32, 3)).astype(np.uint8)
+
+    batch_eye = retina.init_batch_retina((24, 32), num_streams=3)
+    group_eye = retina.init_batch_retina((24, 32), num_streams=3)
+
+    group_bytes = numpy_retina.BATCH_GROUP_BYTES
+    try:
+        for step in range(frames.shape[0]):
+            parvo, magno = retina.get_opl_batch(batch_eye, frames[step])
+            # groups of two streams then one stream
+            numpy_retina.BATCH_GROUP_BYTES = 2*3*24*32*4
+            group_parvo, group_magno = retina.get_opl_batch(
+                group_eye, frames[step])
+            numpy_retina.BATCH_GROUP_BYTES = group_bytes
+
+            assert_true(np.array_equal(parvo, group_parvo))
+            assert_true(np.array_equal(magno, group_magno))
+    finally:
+        numpy_retina.BATCH_GROUP_BYTES = group_bytes
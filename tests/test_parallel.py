@@ -0,0 +1,164 @@
+"""Test parallel module.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import shutil
+import tempfile
+from os.path import join
+
+import numpy as np
+from simretina import dataset, events, package_data_path, parallel, retina
+
+from nose.tools import assert_equal, assert_true
+
+
+def count_frames(outputs):
+    """Count processed frames in a worker."""
+    return outputs[0].shape[0]
+
+
+def test_process_videos():
+    """Test parallel.process_videos function."""
+    hr_path = join(package_data_path, "HorseRiding.avi")
+    bad_path = join(package_data_path, "missing.avi")
+
+    results = dict((vid_path, (outputs, error))
+                   for vid_path, outputs, error in parallel.process_videos(
+                       [hr_path, bad_path], max_workers=2,
+                       process_fn=count_frames))
+
+    assert_equal(len(results), 2)
+    assert_true(results[hr_path][0] > 0)
+    assert_true(results[hr_path][1] is None)
+    assert_true(results[bad_path][1] is not None)
+
+
+def test_get_opl_frames_chunked():
+    """Test parallel.get_opl_frames_chunked function."""
+    rng = np.random.RandomState(42)
+    frames = [rng.randint(0, 256, size=(48, 64, 3)).astype(np.uint8)
+              for i in range(12)]
+
+    eye = retina.init_retina(frames[0].shape[:2])
+    parvo_ref, magno_ref = retina.get_opl_frames(eye, frames, stack=True)
+
+    (parvo, magno), report = parallel.get_opl_frames_chunked(
+        frames, num_chunks=1, max_workers=1)
+
+    assert_true(np.array_equal(parvo, parvo_ref))
+    assert_true(np.array_equal(magno, magno_ref))
+    assert_equal(report["boundary_deviations"], [])
+
+    magno, report = parallel.get_opl_frames_chunked(
+        frames, num_chunks=3, warmup_frames=2, probe_frames=2,
+        max_workers=2, get_parvo=False)
+
+    assert_equal(magno.shape, magno_ref.shape)
+    assert_equal(len(report["boundary_deviations"]), 2)
+
+    # the workers map their own rows of a memory-mapped array
+    temp_dir = tempfile.mkdtemp()
+    try:
+        frames_path = join(temp_dir, "frames.npy")
+        np.save(frames_path, np.stack(frames))
+        frames_map = np.load(frames_path, mmap_mode="r")
+        for sequence, reference in ((frames_map, magno),
+                                    (frames_map[3:], None)):
+            if reference is None:
+                reference, _ = parallel.get_opl_frames_chunked(
+                    frames[3:], num_chunks=3, warmup_frames=2,
+                    probe_frames=2, max_workers=2, get_parvo=False)
+            map_magno, _ = parallel.get_opl_frames_chunked(
+                sequence, num_chunks=3, warmup_frames=2, probe_frames=2,
+                max_workers=2, get_parvo=False)
+            assert_true(np.array_equal(map_magno, reference))
+        del frames_map
+    finally:
+        shutil.rmtree(temp_dir)
+
+    # the workers decode their own range of a video
+    video = dataset.Video(join(package_data_path, "HorseRiding.avi"))[:12]
+    video_frames = list(video)
+    (parvo, magno), _ = parallel.get_opl_frames_chunked(
+        video, num_chunks=2, warmup_frames=2, probe_frames=2, max_workers=2)
+    (parvo_ref, magno_ref), _ = parallel.get_opl_frames_chunked(
+        video_frames, num_chunks=2, warmup_frames=2, probe_frames=2,
+        max_workers=2)
+
+    assert_true(np.array_equal(parvo, parvo_ref))
+    assert_true(np.array_equal(magno, magno_ref))
+
+
+def test_tiled_retina():
+    """Test parallel.TiledRetina class."""
+    rng = np.random.RandomState(42)
+    frames = [rng.randint(0, 256, size=(48, 64, 3)).astype(np.uint8)
+              for i in range(3)]
+
+    eye = retina.init_retina(frames[0].shape[:2])
+    parvo_ref, magno_ref = retina.get_opl_frames(eye, frames, stack=True)
+
+    # a single tile covers the whole frame
+    tiled_eye = parallel.TiledRetina(frames[0].shape[:2], tile_size=(64, 64))
+    parvo, magno = retina.get_opl_frames(tiled_eye, frames, stack=True)
+
+    assert_true(np.array_equal(parvo, parvo_ref))
+    assert_true(np.array_equal(magno, magno_ref))
+
+    # raw outputs and events read the float outputs
+    parvo_ref, magno_ref = retina.get_opl_frames(eye, frames, stack=True,
+                                                 raw=True)
+    parvo, magno = retina.get_opl_frames(tiled_eye, frames, stack=True,
+                                         raw=True)
+
+    assert_equal(tiled_eye.getOutputSize(), eye.getOutputSize())
+    assert_true(np.allclose(parvo, parvo_ref, atol=1e-3))
+    assert_true(np.allclose(magno, magno_ref, atol=1e-3))
+    assert_true(np.array_equal(events.get_events(tiled_eye, frames),
+                               events.get_events(eye, frames)))
+    tiled_eye.close()
+
+    # four tiles with the default halo on a natural video, the outputs
+    # are normalised once, the parvo gains of the tiles are approximated
+    frames = dataset.get_horse_riding(size=False)[:6]
+    eye = retina.init_retina(frames[0].shape[:2])
+    parvo_ref, magno_ref = retina.get_opl_frames(eye, frames, stack=True)
+
+    tiled_eye = parallel.TiledRetina(frames[0].shape[:2],
+                                     tile_size=(120, 160))
+    parvo, magno = retina.get_opl_frames(tiled_eye, frames, stack=True)
+    tiled_eye.close()
+
+    assert_equal(len(tiled_eye.tiles), 4)
+    assert_equal(parvo.shape, parvo_ref.shape)
+    assert_equal(magno.shape, magno_ref.shape)
+    # mean absolute differences in grey levels
+    assert_true(np.abs(parvo.astype(int)-parvo_ref).mean() < 5.)
+    assert_true(np.abs(magno.astype(int)-magno_ref).mean() < 2.)
+
+
+def test_sweep_params():
+    """Test parallel.sweep_params function."""
+    rng = np.random.RandomState(42)
+    frames = [rng.randint(0, 256, size=(24, 32, 3)).astype(np.uint8)
+              for i in range(4)]
+    para_dict = retina.create_para_dict(True, True, 0.75, 0.9, 0.53, 0.01,
+                                        0.5, 7., 0.75, True, 0., 0., 7., 2.,
+                                        0.95, 0., 7.)
+
+    candidates = parallel.make_para_grid(para_dict,
+                                         {"parasol_cells_k": [3., 7.]})
+    results = parallel.sweep_params(frames, candidates, store_outputs=True,
+                                    max_workers=2, get_parvo=False)
+
+    assert_equal(len(results), 2)
+    for candidate, metrics, magno in results:
+        eye = retina.init_retina(frames[0].shape[:2])
+        retina.apply_para_dict(eye, candidate)
+        magno_ref = retina.get_opl_frames(eye, frames, get_parvo=False,
+                                          stack=True)
+
+        assert_true(np.array_equal(magno, magno_ref))
+        assert_true("magno_mean" in metrics)
@@ -0,0 +1,85 @@
+"""Test pipeline module.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import time
+
+import numpy as np
+from simretina import pipeline, retina
+
+from nose.tools import assert_equal, assert_true, assert_raises
+
+
+def get_test_frames(num_frames=5, size=(48, 64)):
+    """Make a reproducible sequence of random color frames."""
+    rng = np.random.RandomState(42)
+    return [rng.randint(0, 256, size=(size[0], size[1], 3)).astype(np.uint8)
+            for i in range(num_frames)]
+
+
+def test_run_pipeline():
+    """Test pipeline.run_pipeline function."""
+    frames = get_test_frames()
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    magno_frames = retina.get_opl_frames(eye, frames, get_parvo=False)
+    results, stats = pipeline.run_pipeline(eye, iter(frames),
+                                           get_parvo=False, queue_size=2)
+
+    assert_equal(len(results), len(frames))
+    for magno, magno_ref in zip(results, magno_frames):
+        assert_true(np.array_equal(magno, magno_ref))
+    for stage in ("decode", "retina", "post"):
+        assert_equal(stats[stage]["frames"], len(frames))
+
+
+def test_run_pipeline_error():
+    """Test pipeline.run_pipeline function with a failing stage."""
+    frames = get_test_frames()
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    def fail(outputs):
+        raise RuntimeError("post-processing failed")
+
+    assert_raises(RuntimeError, pipeline.run_pipeline, eye, frames,
+                  process_fn=fail)
+
+
+class FakeCapture(object):
+    """A live source that delivers frames at a fixed rate."""
+
+    def __init__(self, frames, frame_rate=200.):
+        self.frames = list(frames)
+        self.interval = 1./frame_rate
+        self.released = False
+
+    def read(self):
+        time.sleep(self.interval)
+        if len(self.frames) == 0:
+            return False, None
+        return True, self.frames.pop(0)
+
+    def release(self):
+        self.released = True
+
+
+def test_run_live():
+    """Test pipeline.run_live function."""
+    frames = get_test_frames(num_frames=40, size=(120, 160))
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    for merge in (False, True):
+        capture = FakeCapture(frames)
+        source = pipeline.LiveSource(capture, latency_budget=1.,
+                                     merge=merge)
+        stats = pipeline.run_live(eye, source)
+        source.release()
+
+        assert_true(capture.released)
+        assert_equal(stats["grabbed"], len(frames))
+        assert_true(stats["processed"] > 0)
+        assert_equal(stats["processed"]+stats["dropped"] +
+                     stats["merged"]+stats["skipped"], len(frames))
+        assert_true(stats["fps"] > 0)
@@ -0,0 +1,51 @@
+"""Test profiling module.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from simretina import profiling, retina
+
+from nose.tools import assert_equal, assert_true
+
+
+def test_profiling():
+    """Test the stage counters of the profiling module."""
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    eye = retina.init_retina(frame.shape[:2])
+
+    profiling.reset()
+    retina.get_opl_frame(eye, frame)
+    assert_equal(profiling.snapshot(), {})
+
+    profiling.enable()
+    try:
+        for idx in range(3):
+            retina.get_opl_frame(eye, frame)
+    finally:
+        profiling.disable()
+
+    stats = profiling.snapshot()
+    for stage in ("retina.run", "retina.getParvo", "retina.getMagno"):
+        assert_equal(stats[stage]["count"], 3)
+        assert_equal(sum(stats[stage]["histogram"]), 3)
+        assert_true(stats[stage]["min"] <= stats[stage]["mean"] <=
+                    stats[stage]["max"])
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        dump_path = os.path.join(temp_dir, "profile.json")
+        profiling.start_dump(dump_path, interval=10.)
+        profiling.stop_dump()
+        with open(dump_path) as dump_file:
+            dumped = json.load(dump_file)
+        assert_equal(dumped["stages"]["retina.run"]["count"], 3)
+    finally:
+        shutil.rmtree(temp_dir)
+        profiling.reset()
@@ -0,0 +1,325 @@
+"""Test retina module.
+
+Author: Yuhuang Hu
+Email : yuhuang.hu@uzh.ch
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+from simretina import dataset, package_data_path, retina
+
+from nose.tools import assert_equal, assert_true, assert_raises
+
+
+def get_test_frames(num_frames=5, size=(48, 64)):
+    """Make a reproducible sequence of random color frames."""
+    rng = np.random.RandomState(42)
+    return [rng.randint(0, 256, size=(size[0], size[1], 3)).astype(np.uint8)
+            for i in range(num_frames)]
+
+
+def test_iter_opl_frames():
+    """Test retina.iter_opl_frames function."""
+    frames = get_test_frames()
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames)
+    out_frames = list(retina.iter_opl_frames(eye, iter(frames)))
+
+    assert_equal(len(out_frames), len(frames))
+    for (parvo, magno), parvo_ref, magno_ref in zip(
+            out_frames, parvo_frames, magno_frames):
+        assert_true(np.array_equal(parvo, parvo_ref))
+        assert_true(np.array_equal(magno, magno_ref))
+
+
+def test_get_opl_frames_stack():
+    """Test retina.get_opl_frames function with stacked output."""
+    frames = get_test_frames()
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames)
+    parvo_stack, magno_stack = retina.get_opl_frames(eye, frames, stack=True)
+
+    assert_equal(parvo_stack.shape, (len(frames),)+parvo_frames[0].shape)
+    assert_true(np.array_equal(parvo_stack, np.array(parvo_frames)))
+    assert_true(np.array_equal(magno_stack, np.array(magno_frames)))
+
+    magno_out = np.zeros_like(magno_stack)
+    magno_res = retina.get_opl_frames(eye, frames, get_parvo=False,
+                                      out=magno_out)
+
+    assert_true(magno_res is magno_out)
+    assert_true(np.array_equal(magno_out, magno_stack))
+
+    # wrong buffers are rejected before the retina runs a frame
+    eye = retina.init_retina(frames[0].shape[:2])
+    retina.get_opl_frames(eye, frames[:2])
+    for out in (np.zeros((2,)+parvo_stack.shape[1:], dtype=np.uint8),
+                (np.zeros(parvo_stack.shape, dtype=np.float32), None),
+                (None, np.zeros(magno_stack.shape[:1]+(64, 48, 3),
+                                dtype=np.uint8))):
+        assert_raises(ValueError, retina.get_opl_frames, eye, frames[2:],
+                      reopen_eye=False, out=out)
+    parvo_res, magno_res = retina.get_opl_frames(eye, frames[2:],
+                                                 reopen_eye=False,
+                                                 stack=True)
+
+    assert_true(np.array_equal(parvo_res, parvo_stack[2:]))
+    assert_true(np.array_equal(magno_res, magno_stack[2:]))
+
+
+def test_gray2color_view():
+    """Test retina.gray2color function with view output."""
+    frame = get_test_frames(num_frames=1)[0][:, :, 0]
+
+    color_view = retina.gray2color(frame, view=True)
+
+    assert_equal(color_view.shape, frame.shape+(3,))
+    assert_true(np.shares_memory(color_view, frame))
+    assert_true(np.array_equal(color_view, retina.gray2color(frame)))
+
+
+def test_get_opl_frame_expand_mode():
+    """Test retina.get_opl_frame function without gray expansion."""
+    frame = get_test_frames(num_frames=1)[0]
+    eye = retina.init_retina(frame.shape[:2])
+
+    parvo, magno = retina.get_opl_frame(eye, frame, expand_mode="none")
+
+    assert_equal(parvo.shape, frame.shape)
+    assert_equal(magno.shape, frame.shape[:2])
+
+
+def test_retina_pool():
+    """Test retina.RetinaPool class."""
+    pool = retina.RetinaPool(max_size=2)
+
+    eye_a = pool.get((48, 64))
+    eye_b = pool.get((32, 32))
+
+    assert_true(pool.get((48, 64)) is eye_a)
+    assert_equal(len(pool), 2)
+
+    # (32, 32) is the least recently used one
+    pool.get((16, 16))
+
+    assert_equal(len(pool), 2)
+    assert_true(pool.get((32, 32)) is not eye_b)
+
+
+def get_test_para_dict():
+    """Make a parameter dictionary with the default setup."""
+    return retina.create_para_dict(True, True, 0.75, 0.9, 0.53, 0.01, 0.5, 7.,
+                                   0.75, True, 0., 0., 7., 2., 0.95, 0., 7.)
+
+
+def test_retina_params():
+    """Test retina.RetinaParams class."""
+    para_dict = get_test_para_dict()
+    params = retina.RetinaParams.from_dict(para_dict)
+
+    assert_equal(params, retina.RetinaParams(**para_dict))
+    assert_equal(hash(params), hash(retina.RetinaParams(**para_dict)))
+    assert_true(retina.compare_para_dict(params, para_dict))
+    assert_equal(pickle.loads(pickle.dumps(params)), params)
+    assert_raises(AttributeError, setattr, params, "parasol_cells_k", 5.)
+
+    new_params = params.replace(parasol_cells_k=5.)
+
+    assert_true(not retina.compare_para_dict(params, new_params))
+    assert_equal(new_params["parasol_cells_k"], 5.)
+
+
+class SetupRecorder(object):
+    """Record the setup calls made on a retina."""
+
+    def __init__(self):
+        self.calls = []
+
+    def setupIPLMagnoChannel(self, *args):
+        self.calls.append("magno")
+
+    def setupOPLandIPLParvoChannel(self, *args):
+        self.calls.append("parvo")
+
+
+def test_apply_para_changes():
+    """Test retina.apply_para_changes function."""
+    params = retina.RetinaParams.from_dict(get_test_para_dict())
+    eye = SetupRecorder()
+
+    reset = retina.apply_para_changes(eye, params,
+                                      params.replace(parasol_cells_k=5.))
+
+    assert_equal(eye.calls, ["magno"])
+    assert_true(not reset)
+
+    reset = retina.apply_para_changes(eye, params,
+                                      params.replace(color_mode=False))
+
+    assert_equal(eye.calls, ["magno", "parvo"])
+    assert_true(reset)
+
+
+def test_foveated_retina():
+    """Test retina.init_retina function with log sampling."""
+    frames = get_test_frames(num_frames=2)
+    eye = retina.init_retina(frames[0].shape[:2], reduction_factor=2.)
+
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames)
+
+    assert_equal(eye.getOutputSize(), (32, 24))
+    assert_equal(magno_frames[0].shape, (24, 32, 3))
+
+    maps = retina.init_back_projection(frames[0].shape[:2], 2.)
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames,
+                                                       back_project=maps)
+
+    assert_equal(parvo_frames[0].shape, frames[0].shape)
+    assert_equal(magno_frames[0].shape, frames[0].shape)
+    assert_true(retina.init_back_projection(frames[0].shape[:2], 2.)
+                is maps)
+    assert_raises(ValueError, retina.get_opl_frames, eye, frames,
+                  back_project=True)
+
+
+def test_back_projection():
+    """Test that the back projection keeps features in place."""
+    size = (120, 160)
+    maps = retina.init_back_projection(size, 2.)
+
+    for position in ((60, 110), (30, 130), (90, 50), (25, 80)):
+        frame = np.full(size+(3,), 40, dtype=np.uint8)
+        cv2.circle(frame, position[::-1], 3, (255, 255, 255), -1)
+        eye = retina.init_retina(size, reduction_factor=2.)
+
+        parvo_frames = retina.get_opl_frames(eye, [frame]*4,
+                                             get_magno=False,
+                                             back_project=maps)
+        parvo_frame = cv2.blur(parvo_frames[-1].mean(axis=2), (5, 5))
+        peak = np.unravel_index(np.argmax(parvo_frame), size)
+
+        assert_true(np.abs(np.array(peak)-position).max() <= 3)
+
+
+def test_tone_map_images():
+    """Test retina.tone_map_images function."""
+    results = list(retina.tone_map_images(package_data_path))
+
+    assert_equal(len(results), 3)
+    for image_path, tone_mapped_frame in results:
+        assert_equal(tone_mapped_frame.shape,
+                     dataset.get_image(image_path, size=False).shape)
+
+
+def test_channel_selection():
+    """Test that single channel outputs match the full computation."""
+    frames = get_test_frames()
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames)
+    parvo_only = retina.get_opl_frames(eye, frames, get_magno=False)
+    magno_only = retina.get_opl_frames(eye, frames, get_parvo=False,
+                                       stack=True)
+
+    for idx in range(len(frames)):
+        assert_true(np.array_equal(parvo_only[idx], parvo_frames[idx]))
+        assert_true(np.array_equal(magno_only[idx], magno_frames[idx]))
+
+    # both channels are computed again once requested
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames)
+    assert_true(np.array_equal(magno_only[-1], magno_frames[-1]))
+
+
+def test_raw_frames():
+    """Test the float32 raw output mode of retina.get_opl_frames."""
+    frames = get_test_frames()
+    eye = retina.init_retina(frames[0].shape[:2])
+
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames,
+                                                       raw=True)
+
+    assert_equal(parvo_frames[0].shape, (48, 64, 3))
+    assert_equal(parvo_frames[0].dtype, np.float32)
+    assert_equal(magno_frames[0].shape, (48, 64))
+    assert_equal(magno_frames[0].dtype, np.float32)
+
+    # the raw frames are the BGR outputs before the 8-bit conversion
+    parvo_frame, magno_frame = retina.get_opl_frames(eye, frames,
+                                                     expand_mode="none")
+    assert_true(np.abs(parvo_frames[-1]-parvo_frame[-1]).max() <= 1)
+
+    parvo_out = np.empty((len(frames), 48, 64, 3), dtype=np.float32)
+    magno_out = np.empty((len(frames), 48, 64), dtype=np.float32)
+    retina.get_opl_frames(eye, frames, raw=True, out=(parvo_out, magno_out))
+
+    assert_true(np.array_equal(parvo_out[-1], parvo_frames[-1]))
+    assert_true(np.array_equal(magno_out[-1], magno_frames[-1]))
+
+
+def test_scaled_retina():
+    """Test the reduced resolution mode of the retina."""
+    frames = get_test_frames(size=(48, 64))
+    eye = retina.init_retina(frames[0].shape[:2], scale=0.5)
+
+    assert_equal(tuple(eye.getInputSize()), (32, 24))
+
+    parvo_frames, magno_frames = retina.get_opl_frames(eye, frames,
+                                                       scale=0.5)
+    assert_equal(parvo_frames[0].shape, (24, 32, 3))
+
+    parvo_frames, magno_frames = retina.get_opl_frames(
+        eye, frames, scale=0.5, upsample=True)
+    assert_equal(parvo_frames[0].shape, frames[0].shape)
+    assert_equal(magno_frames[0].shape, frames[0].shape)
+
+    para_dict = retina.scale_para_dict(None, 0.5)
+    assert_equal(para_dict["hcells_spatial_constant"], 3.5)
+    assert_raises(ValueError, retina.init_retina, (48, 64), scale=2.)
+
+    fidelity = retina.get_scale_fidelity(frames, 0.5)
+    assert_true(fidelity["magno_correlation"] <= 1.)
+
+
+def test_save_load_state():
+    """Test retina.save_state and retina.load_state functions."""
+    # a pre-roll longer than the replayed frames, so that the OpenCV
+    # retina resumes from a replay that does not cover its whole history
+    frames = get_test_frames(num_frames=26)
+    temp_dir = tempfile.mkdtemp()
+    state_path = os.path.join(temp_dir, "state.npz")
+
+    try:
+        for backend in ("numpy", "opencv"):
+            eye = retina.init_retina(frames[0].shape[:2], backend=backend)
+            retina.get_opl_frames(eye, frames[:20])
+            retina.save_state(eye, state_path, frames=frames[14:20])
+            outputs = retina.get_opl_frames(eye, frames[20:],
+                                            reopen_eye=False)
+
+            new_eye = retina.load_state(state_path)
+            new_outputs = retina.get_opl_frames(new_eye, frames[20:],
+                                                reopen_eye=False)
+
+            for output_frames, new_output_frames in zip(outputs,
+                                                        new_outputs):
+                for idx, (frame, new_frame) in enumerate(
+                        zip(output_frames, new_output_frames)):
+                    diff = np.abs(frame.astype(np.int32)-new_frame)
+                    # the numpy backend resumes exactly, the OpenCV
+                    # retina re-converges within three frames and stays
+                    # within 1 grey level on average meanwhile
+                    assert_true(diff.mean() < 1.)
+                    if backend == "numpy" or idx >= 3:
+                        assert_true(diff.max() <= 1)
+
+        assert_raises(ValueError, retina.load_state, state_path,
+                      retina.init_retina((24, 32)))
+    finally:
+        shutil.rmtree(temp_dir)